@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from threading import Lock
+import copy
+import os
+import time
+import uuid
+
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import BaseAuthentication
+
+from .grader_utils import metrics
+from .models import Professor, Student, UserToken
+
+
+# Token authentication for every API view: "Authorization: Token <token>" is
+# resolved to a Principal (the token's user type and its Professor or Student
+# row), available to views as request.user. Resolved tokens are kept in a
+# per-process cache for CACHE_TTL seconds, so an authenticated request costs
+# no queries before the view's own work; each request gets its own copy of the
+# user row. Deleting a token (logout) or saving or deleting a user drops the
+# entries of this process at once and changes a generation value in the shared
+# cache (settings.CACHES). Every process reads that value at most once per
+# REVOCATION_CHECK_SECONDS and clears its cache when it changed, so other
+# processes apply the change within that interval. That read is one query
+# every few seconds per process with the database cache, not one per request.
+
+KEYWORD = "Token"
+# Seconds a resolved token is remembered (0 = always query)
+CACHE_TTL = float(os.getenv('AUTH_TOKEN_CACHE_TTL', '30'))
+CACHE_MAX_ENTRIES = int(os.getenv('AUTH_TOKEN_CACHE_MAX_ENTRIES', '10000'))
+# Longest a logout or user change in another process goes unnoticed here
+REVOCATION_CHECK_SECONDS = float(os.getenv('AUTH_REVOCATION_CHECK_SECONDS', '2'))
+GENERATION_KEY = "auth:generation"
+
+USER_MODELS = {"professor": Professor, "student": Student}
+
+
+class Principal:
+    """
+    The professor or student a token belongs to. `user` is the Professor or
+    Student row, None if it was deleted while the token was kept.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token, user_type, user_id, user):
+        self.token = token
+        self.user_type = user_type
+        self.user_id = user_id
+        self.user = user
+
+    @property
+    def is_professor(self):
+        return self.user_type == "professor"
+
+    @property
+    def is_student(self):
+        return self.user_type == "student"
+
+    def copy(self):
+        # Views may change request.user.user; the cached instance stays untouched
+        user = copy.copy(self.user) if self.user is not None else None
+        return Principal(self.token, self.user_type, self.user_id, user)
+
+    def __repr__(self):
+        return f"<Principal {self.user_type} {self.user_id}>"
+
+
+def token_from_header(request):
+    """
+    The token of an "Authorization: Token <token>" header, None without one.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith(KEYWORD + " "):
+        return None
+    return auth_header.split(" ")[1] or None
+
+
+class PrincipalCache:
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = CACHE_TTL if ttl is None else ttl
+        self.max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        # token -> (expires_at, principal)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        # Shared generation the entries were cached under, and when it was last read
+        self.generation = None
+        self.checked_at = None
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def set(self, token, principal, generation=None):
+        """
+        Remember a principal read while `generation` was current; dropped if it changed since.
+        """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[token] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_token(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def invalidate_user(self, user_type, user_id):
+        with self._lock:
+            stale = [
+                token for token, (_, principal) in self._entries.items()
+                if principal.user_type == user_type and principal.user_id == user_id
+            ]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def sync(self, read_generation):
+        """
+        Clear the cache if the shared generation changed; reads it at most once per
+        REVOCATION_CHECK_SECONDS. Returns the generation new entries belong to.
+        """
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < REVOCATION_CHECK_SECONDS:
+            return self.generation
+        self.checked_at = now
+        try:
+            generation = read_generation()
+        except Exception as e:
+            print(f"Auth: shared cache unavailable, dropping cached tokens: {e}")
+            generation = object()
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+        return generation
+
+
+cache = PrincipalCache()
+
+
+def resolve(token):
+    """
+    The Principal of a token, or None if no such token exists.
+    """
+    generation = cache.sync(lambda: shared_cache.get(GENERATION_KEY))
+    principal = cache.get(token)
+    if principal is not None:
+        metrics.AUTH_LOOKUPS.inc(result="hit")
+        return principal.copy()
+
+    row = UserToken.objects.filter(token=token).values_list("user_type", "user_id").first()
+    if row is None:
+        metrics.AUTH_LOOKUPS.inc(result="invalid")
+        return None
+    user_type, user_id = row
+    model = USER_MODELS.get(user_type)
+    user = model.objects.filter(id=user_id).first() if model is not None else None
+    principal = Principal(token, user_type, user_id, user)
+    cache.set(token, principal, generation)
+    metrics.AUTH_LOOKUPS.inc(result="miss")
+    return principal.copy()
+
+
+def publish_revocation():
+    # Once committed, so no process can re-cache the old rows after seeing it
+    transaction.on_commit(lambda: shared_cache.set(GENERATION_KEY, uuid.uuid4().hex, None))
+
+
+class CachedTokenAuthentication(BaseAuthentication):
+    """
+    Sets request.user to the token's Principal. Requests without a valid token
+    are left anonymous rather than rejected, so each view still answers them
+    with its own 401.
+    """
+
+    def authenticate(self, request):
+        token = token_from_header(request)
+        if token is None:
+            return None
+        principal = resolve(token)
+        if principal is None:
+            return None
+        return principal, token
+
+    def authenticate_header(self, request):
+        return KEYWORD
+
+
+def user_changed(user_type, user_id):
+    cache.invalidate_user(user_type, user_id)
+    publish_revocation()
+
+
+@receiver(post_delete, sender=UserToken)
+def token_deleted(sender, instance, **kwargs):
+    cache.invalidate_token(instance.token)
+    publish_revocation()
+
+
+@receiver(post_save, sender=Professor)
+@receiver(post_delete, sender=Professor)
+def professor_changed(sender, instance, **kwargs):
+    user_changed("professor", instance.id)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, instance, **kwargs):
+    user_changed("student", instance.id)
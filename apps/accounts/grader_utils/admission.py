@@ -0,0 +1,142 @@
+from threading import Lock
+import math
+import os
+
+from . import metrics
+from . import scheduler
+
+
+# Admission control for requests that grade synchronously. A request is only
+# admitted while this process has fewer than MAX_IN_FLIGHT of them running
+# and fewer than MAX_QUEUED LLM requests waiting for a scheduler slot at its
+# priority or above. Rejected requests get 503 with a Retry-After estimate, so
+# a growing LLM backlog cannot tie up every web worker thread and stall cheap
+# endpoints (logins, exam submission) along with it.
+
+# Grading requests running at once in this process (0 = no limit)
+MAX_IN_FLIGHT = int(os.getenv('GRADING_MAX_IN_FLIGHT', '8'))
+# LLM requests waiting for a slot (0 = no limit)
+MAX_QUEUED = int(os.getenv('GRADING_MAX_QUEUED_LLM_REQUESTS', '64'))
+# Assumed LLM call time until calls have been observed, for Retry-After
+DEFAULT_CALL_SECONDS = float(os.getenv('GRADING_DEFAULT_CALL_SECONDS', '5'))
+MAX_RETRY_AFTER = int(os.getenv('GRADING_MAX_RETRY_AFTER', '120'))
+
+
+class Overloaded(Exception):
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Grading is overloaded ({reason}). Retry in {retry_after} seconds.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    An admitted request. Release it when the request is done (idempotent).
+    """
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+        self._lock = Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ReleasingIterator:
+    """
+    Wraps a streamed response body; the ticket is released when the server
+    closes the response, even if the body was never iterated.
+    """
+
+    def __init__(self, iterable, ticket):
+        self._iterator = iter(iterable)
+        self._ticket = ticket
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._ticket.release()
+
+
+class AdmissionController:
+
+    def __init__(self, max_in_flight=None, max_queued=None):
+        self.max_in_flight = MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        self.max_queued = MAX_QUEUED if max_queued is None else max_queued
+        self._in_flight = 0
+        self._lock = Lock()
+
+    def admit(self, priority_name="interactive"):
+        """
+        Return a Ticket, or raise Overloaded.
+        """
+        queued = self.queued_ahead(priority_name)
+        with self._lock:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                reason = "in_flight"
+            elif self.max_queued and queued >= self.max_queued:
+                reason = "backlog"
+            else:
+                self._in_flight += 1
+                reason = None
+        if reason is not None:
+            metrics.ADMISSIONS.inc(priority=priority_name, outcome=f"rejected_{reason}")
+            raise Overloaded(
+                "too many grading requests in progress" if reason == "in_flight" else "LLM backlog",
+                self.retry_after(reason, queued),
+            )
+        metrics.ADMISSIONS.inc(priority=priority_name, outcome="admitted")
+        return Ticket(self)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    @staticmethod
+    def queued_ahead(priority_name):
+        # Waiting LLM requests that the scheduler serves before (or with) this priority
+        waiting = scheduler.get_scheduler().stats()["waiting"]
+        rank = scheduler.PRIORITIES.index(priority_name)
+        return sum(waiting[name] for name in scheduler.PRIORITIES[:rank + 1])
+
+    def retry_after(self, reason, queued):
+        if reason == "in_flight":
+            # About when a running request finishes
+            seconds = metrics.EXAM_SECONDS.quantile(0.5) or DEFAULT_CALL_SECONDS
+        else:
+            # About when the backlog ahead has drained
+            call_seconds = metrics.LLM_CALL_SECONDS.quantile(0.5) or DEFAULT_CALL_SECONDS
+            seconds = (queued + 1) * call_seconds / max(1, scheduler.get_scheduler().slots)
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(seconds)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "max_queued": self.max_queued,
+            }
+
+
+controller = AdmissionController()
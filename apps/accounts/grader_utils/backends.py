@@ -0,0 +1,220 @@
+from dataclasses import dataclass, field
+from threading import Lock
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+from .rules import scored_result
+from . import routing
+
+
+# Where Grader sends its prompts. GRADER_BACKEND selects the implementation:
+#   anthropic  the agno Agent / Claude model (default)
+#   fake       deterministic offline stand-in with simulated latency and errors
+#   record     calls Claude and stores every response under GRADER_REPLAY_DIR
+#   replay     answers from GRADER_REPLAY_DIR only, keyed by prompt hash
+BACKEND = os.getenv('GRADER_BACKEND', 'anthropic').lower()
+REPLAY_DIR = os.getenv('GRADER_REPLAY_DIR', os.path.join('graders', 'replay'))
+
+_BATCH_PROMPT = re.compile(r"^Grade each of the following (\d+) answers")
+
+
+class ReplayMissError(LookupError):
+    pass
+
+
+@dataclass
+class BackendMetrics:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+
+@dataclass
+class BackendResponse:
+    """
+    The subset of agno's RunOutput the grader relies on.
+    """
+    content: str
+    metrics: BackendMetrics = field(default_factory=BackendMetrics)
+
+    def get_content_as_string(self):
+        return self.content
+
+
+def prompt_key(grader, prompt, route=routing.LARGE):
+    model_id = routing.model_id(route) or ""
+    payload = "\x1e".join([model_id, grader.system_prompt(), prompt])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnthropicBackend:
+    name = "anthropic"
+
+    def run(self, grader, prompt, route=routing.LARGE):
+        return grader.agent_for(route).run(prompt)
+
+
+class FakeBackend:
+    """
+    Offline model for benchmarks and load tests. Responses are valid grader JSON
+    (or, at `error_rate`, invalid text that triggers the grader's retry path).
+    Latency is log-normal around `latency_ms` with spread `latency_sigma`.
+    The small model route is `small_latency_factor` times as slow and fails
+    validation at `small_error_rate`.
+    For a given prompt, the n-th attempt always behaves the same way.
+    """
+    name = "fake"
+
+    def __init__(self, latency_ms=None, latency_sigma=None, error_rate=None, seed=None,
+                 small_latency_factor=None, small_error_rate=None):
+        self.latency_ms = float(latency_ms if latency_ms is not None else os.getenv('GRADER_FAKE_LATENCY_MS', '800'))
+        self.latency_sigma = float(latency_sigma if latency_sigma is not None else os.getenv('GRADER_FAKE_LATENCY_SIGMA', '0.5'))
+        self.error_rate = float(error_rate if error_rate is not None else os.getenv('GRADER_FAKE_ERROR_RATE', '0'))
+        self.seed = str(seed if seed is not None else os.getenv('GRADER_FAKE_SEED', '0'))
+        self.small_latency_factor = float(small_latency_factor if small_latency_factor is not None
+                                          else os.getenv('GRADER_FAKE_SMALL_LATENCY_FACTOR', '0.4'))
+        self.small_error_rate = float(small_error_rate if small_error_rate is not None
+                                      else os.getenv('GRADER_FAKE_SMALL_ERROR_RATE', '0'))
+        self.calls = 0
+        self._attempts = {}
+        self._lock = Lock()
+
+    def run(self, grader, prompt, route=routing.LARGE):
+        key = prompt_key(grader, prompt, route)
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+            self.calls += 1
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        small = route == routing.SMALL
+
+        if self.latency_ms > 0:
+            factor = self.small_latency_factor if small else 1
+            time.sleep(rng.lognormvariate(0, self.latency_sigma) * self.latency_ms * factor / 1000)
+
+        if rng.random() < self.error_rate:
+            content = "Here is the grading you asked for, but not as JSON."
+        elif small and rng.random() < self.small_error_rate:
+            # Parses, but the total is out of range
+            content = json.dumps({"results": []} if _BATCH_PROMPT.match(prompt) else
+                                 {"criteria": [], "total_score": {"result": -1}})
+        else:
+            content = json.dumps(self.fake_result(grader, prompt, rng))
+
+        from .grader import estimate_tokens
+        return BackendResponse(content, BackendMetrics(
+            input_tokens=estimate_tokens(grader.system_prompt()) + estimate_tokens(prompt),
+            output_tokens=estimate_tokens(content),
+        ))
+
+    def fake_result(self, grader, prompt, rng):
+        batch = _BATCH_PROMPT.match(prompt)
+        if batch:
+            results = []
+            for answer_id in range(1, int(batch.group(1)) + 1):
+                result = self.single_result(grader, rng)
+                result["answer_id"] = answer_id
+                results.append(result)
+            return {"results": results}
+        return self.single_result(grader, rng)
+
+    def single_result(self, grader, rng):
+        score = round(rng.uniform(0, 1), 2)
+        result = scored_result("Overall quality", "Simulated grading.", score, grader.overall_score, None)
+        result.pop("short_circuit")
+        return result
+
+
+class RecordReplayBackend:
+    """
+    'record' passes calls to `inner` and appends each response to
+    <directory>/<prompt hash>.json; 'replay' serves those files in order
+    (cycling when a prompt is asked more often than it was recorded) and never
+    touches the network.
+    """
+
+    def __init__(self, mode, directory=REPLAY_DIR, inner=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown record/replay mode: {mode}")
+        self.name = mode
+        self.mode = mode
+        self.directory = directory
+        self.inner = inner or AnthropicBackend()
+        self._served = {}
+        self._lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def run(self, grader, prompt, route=routing.LARGE):
+        key = prompt_key(grader, prompt, route)
+        if self.mode == "replay":
+            return self.replay(key)
+
+        response = self.inner.run(grader, prompt, route)
+        metrics = getattr(response, "metrics", None)
+        entry = {
+            "content": response.get_content_as_string(),
+            "metrics": {name: getattr(metrics, name, 0) or 0 for name in BackendMetrics.__dataclass_fields__},
+        }
+        with self._lock:
+            entries = self.load(key)
+            entries.append(entry)
+            with open(self.path(key), "w") as file_handler:
+                json.dump(entries, file_handler)
+        return response
+
+    def replay(self, key):
+        with self._lock:
+            entries = self.load(key)
+            if not entries:
+                raise ReplayMissError(f"No recorded response for prompt {key}")
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+        entry = entries[served % len(entries)]
+        return BackendResponse(entry["content"], BackendMetrics(**entry.get("metrics", {})))
+
+    def load(self, key):
+        try:
+            with open(self.path(key)) as file_handler:
+                return json.load(file_handler)
+        except FileNotFoundError:
+            return []
+
+
+_backend = None
+_backend_lock = Lock()
+
+
+def create_backend(name):
+    if name == "anthropic":
+        return AnthropicBackend()
+    if name == "fake":
+        return FakeBackend()
+    if name in ("record", "replay"):
+        return RecordReplayBackend(name)
+    raise ValueError(f"Unknown GRADER_BACKEND: {name}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(BACKEND)
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Swap the process-wide backend (benchmarks, management commands).
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
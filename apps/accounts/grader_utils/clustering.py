@@ -0,0 +1,50 @@
+import os
+
+import faiss
+import numpy as np
+
+
+# Groups near-identical answers to one question so that only one answer per
+# group has to be graded. Clusters are built greedily: each one starts at the
+# first answer not yet assigned and takes every unassigned answer whose cosine
+# similarity to it is at least SIMILARITY, so every member is close to the
+# answer that opened the cluster.
+
+SIMILARITY = float(os.getenv('GRADER_CLUSTER_SIMILARITY', '0.95'))
+
+
+def cluster_embeddings(embeddings, similarity=None):
+    """
+    embeddings: unit-length rows, one per answer.
+    Returns [(representative, members)] where members are row indexes (the
+    representative included) and the representative is the member most similar
+    to the rest of its cluster.
+    """
+    similarity = SIMILARITY if similarity is None else similarity
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if len(embeddings) == 0:
+        return []
+
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+    # Inner product of unit vectors is the cosine similarity
+    lims, _, neighbours = index.range_search(embeddings, similarity)
+
+    assigned = np.zeros(len(embeddings), dtype=bool)
+    clusters = []
+    for i in range(len(embeddings)):
+        if assigned[i]:
+            continue
+        members = {i}
+        members.update(int(j) for j in neighbours[lims[i]:lims[i + 1]] if not assigned[j])
+        members = sorted(members)
+        assigned[members] = True
+        clusters.append((medoid(embeddings, members), members))
+    return clusters
+
+
+def medoid(embeddings, members):
+    if len(members) <= 2:
+        return members[0]
+    vectors = embeddings[members]
+    return members[int(np.argmax((vectors @ vectors.T).sum(axis=1)))]
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+
+from . import metrics
+from .grader import estimate_tokens
+
+
+# Builds the retrieved context for one question from candidate chunks:
+#   1. MMR picks relevant chunks that are not near-duplicates of each other,
+#   2. chunks that overlap word-for-word (chunk_text's 50-word overlap) are merged,
+#   3. the result is trimmed to a token budget, least relevant text first.
+
+TOKEN_BUDGET = int(os.getenv('GRADER_CONTEXT_TOKEN_BUDGET', '1600'))
+# Chunks fetched from the index before MMR narrows them down
+CANDIDATES = int(os.getenv('GRADER_CONTEXT_CANDIDATES', '8'))
+MMR_LAMBDA = float(os.getenv('GRADER_CONTEXT_MMR_LAMBDA', '0.7'))
+# Cosine similarity above which a candidate is dropped as a near-duplicate
+DUPLICATE_SIMILARITY = float(os.getenv('GRADER_CONTEXT_DUPLICATE_SIMILARITY', '0.95'))
+
+MIN_OVERLAP_WORDS = 10
+MAX_OVERLAP_WORDS = 100
+# A trimmed tail shorter than this is not worth sending
+MIN_TAIL_TOKENS = 50
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def mmr_select(query_embedding, embeddings, k, lambda_mult=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+    """
+    Maximal marginal relevance over candidate embeddings.
+    Returns up to k candidate indexes, most relevant first.
+    """
+    if k <= 0 or len(embeddings) == 0:
+        return []
+    docs = _normalize(np.asarray(embeddings, dtype=np.float32))
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    relevance = docs @ query
+    similarity = docs @ docs.T
+
+    selected = []
+    remaining = list(range(len(docs)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best_position = int(np.argmax(scores))
+        best = remaining.pop(best_position)
+        if redundancy[best_position] >= duplicate_similarity:
+            continue
+        selected.append(best)
+    return selected
+
+
+def _overlap(left_words, right_words):
+    longest = min(len(left_words), len(right_words), MAX_OVERLAP_WORDS)
+    for size in range(longest, MIN_OVERLAP_WORDS - 1, -1):
+        if left_words[-size:] == right_words[:size]:
+            return size
+    return 0
+
+
+def merge_overlapping(pieces):
+    """
+    pieces: [(chunk_id, rank, text)]. Chunks are merged in document (id) order
+    when one ends with the words the next starts with, or contains it outright.
+    Returns [(rank, text)] where rank is the best rank of the merged chunks.
+    """
+    merged = []
+    for chunk_id, rank, text in sorted(pieces):
+        words = text.split()
+        if merged:
+            previous_rank, previous_words = merged[-1]
+            size = _overlap(previous_words, words)
+            if size:
+                merged[-1] = (min(previous_rank, rank), previous_words + words[size:])
+                continue
+            if " ".join(words) in " ".join(previous_words):
+                merged[-1] = (min(previous_rank, rank), previous_words)
+                continue
+        merged.append((rank, words))
+    return [(rank, " ".join(words)) for rank, words in merged]
+
+
+def trim_to_budget(texts, token_budget):
+    kept = []
+    used = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if used + tokens <= token_budget:
+            kept.append(text)
+            used += tokens
+            continue
+        remaining = token_budget - used
+        if remaining >= MIN_TAIL_TOKENS:
+            # ~4 characters per token, cut on a word boundary
+            kept.append(text[:remaining * 4].rsplit(" ", 1)[0])
+        break
+    return kept
+
+
+def build_context(query_embedding, candidates, top_k=3, token_budget=None):
+    """
+    candidates: [(chunk_id, text, embedding)] ordered by retrieval score.
+    Returns the context texts for the grader prompt, most relevant first.
+    """
+    token_budget = TOKEN_BUDGET if token_budget is None else token_budget
+    if not candidates:
+        return []
+
+    chosen = mmr_select(query_embedding, [embedding for _, _, embedding in candidates], top_k)
+    pieces = [(candidates[i][0], rank, candidates[i][1]) for rank, i in enumerate(chosen)]
+    merged = [text for _, text in sorted(merge_overlapping(pieces))]
+    context = trim_to_budget(merged, token_budget)
+
+    metrics.CONTEXT_TOKENS.observe(sum(estimate_tokens(text) for text in context))
+    return context
@@ -0,0 +1,33 @@
+from threading import Lock
+import os
+
+import numpy as np
+
+
+# One sentence-transformer per process, shared by retrieval (views.py) and the
+# reference-answer pre-grader. Loading the model is slow and it holds a few
+# hundred MB, so it is created on first use.
+EMBEDDING_MODEL = os.getenv('GRADER_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+_embedder = None
+_embedder_lock = Lock()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBEDDING_MODEL)
+    return _embedder
+
+
+def encode_normalized(texts):
+    """
+    Embed a list of texts as unit-length float32 rows, so a dot product is the cosine similarity.
+    """
+    embeddings = np.asarray(get_embedder().encode(list(texts), convert_to_numpy=True), dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
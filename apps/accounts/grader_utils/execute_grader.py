@@ -1,8 +1,44 @@
-from .grader import Grader
+from .grader import Grader, empty_usage, summarize_usage, model_settings
+from . import metrics
+from . import scheduler
+from .clustering import cluster_embeddings
+from .embeddings import encode_normalized
 from ..models import Exam
 from ..models import AssessmentQuestion
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+import copy
+import hashlib
 import json
+import os
+import time
+
+# Upper bound on concurrent LLM calls for one grade_exams() run.
+MAX_WORKERS = int(os.getenv('GRADER_MAX_WORKERS', '10'))
+# Seconds (0 = no limit). A question is given QUESTION_DEADLINE from the moment
+# its grading starts; the whole run gets EXAM_DEADLINE. Answers that miss
+# either are returned with status "pending" and feedback None.
+QUESTION_DEADLINE = float(os.getenv('GRADER_QUESTION_DEADLINE', '0'))
+EXAM_DEADLINE = float(os.getenv('GRADER_EXAM_DEADLINE', '0'))
+# Bumped when the layout of to_spec() changes incompatibly.
+SPEC_FORMAT = 1
+
+
+def question_fingerprint(question, question_weight):
+    """
+    Identifies the inputs that decide a question's retrieved context: its text and weight.
+    """
+    payload = f"{question}\x1e{float(question_weight)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def grader_fingerprint(question, question_weight, min_words, reference_answer):
+    """
+    Identifies everything a question's grader puts in its prompts and rules
+    (the exam's rubric is compared separately).
+    """
+    payload = json.dumps([question, float(question_weight), min_words, reference_answer or None])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 class ExecuteGrader:
@@ -14,6 +50,7 @@ class ExecuteGrader:
                  strictness = 1):
         
         self.rubrics_path = rubrics
+        self.strictness = strictness
 
         self.graders = {}
         for asmt in assessments:
@@ -22,7 +59,10 @@ class ExecuteGrader:
                                                  asmt.question, 
                                                  asmt.min_words, 
                                                  asmt.question_weight,
-                                                 strictness = strictness)
+                                                 strictness = strictness,
+                                                 exam_id = getattr(asmt, "exam_id", None),
+                                                 question_id = getattr(asmt, "id", None),
+                                                 reference_answer = getattr(asmt, "reference_answer", None))
 
 
     # def grade_exams(self, answerdata):
@@ -39,21 +79,229 @@ class ExecuteGrader:
 
     #     return answerdata
 
-    def grade_exams(self, answerdata):
+    def grade_exams(self, answerdata, max_workers=None, question_deadline=None, exam_deadline=None):
+        return list(self.iter_grade_exams(answerdata,
+                                          max_workers=max_workers,
+                                          question_deadline=question_deadline,
+                                          exam_deadline=exam_deadline))
+
+    def iter_grade_exams(self, answerdata, max_workers=None, question_deadline=None, exam_deadline=None):
+        """
+        Grade every answer concurrently and yield each one as soon as its grading finishes,
+        so callers can stream results instead of waiting for the slowest question.
+        Answers still running at their deadline are yielded with status "pending";
+        a result that arrives later is discarded.
+        """
+        question_deadline = QUESTION_DEADLINE if question_deadline is None else question_deadline
+        exam_deadline = EXAM_DEADLINE if exam_deadline is None else exam_deadline
+        exam_id = self.exam_id()
+
+        state_lock = Lock()
+        started_at = {}
+        finished = set()
+        expired = set()
+
+        def process(asmt, submitted_at):
+            began = time.perf_counter()
+            metrics.QUEUE_WAIT_SECONDS.observe(began - submitted_at, exam=exam_id)
+            with state_lock:
+                if id(asmt) in expired:
+                    return asmt
+                started_at[id(asmt)] = began
 
-        def process(asmt):
             grader = self.graders.get(asmt.get("question_text"))
-            if grader is None:
-                asmt["feedback"] = None
-                return asmt
+            usage = None
+            feedback = None
+            if grader is not None:
+                usage = empty_usage()
+                feedback = grader.grade_answer(asmt.get("answer_text"), usage=usage)
 
-            feedback = grader.grade_answer(asmt.get("answer_text"))
-            asmt["feedback"] = feedback
+            with state_lock:
+                if id(asmt) not in expired:
+                    asmt["feedback"] = feedback
+                    if usage is not None:
+                        asmt["token_usage"] = usage
+                    asmt["status"] = "graded"
+                    finished.add(id(asmt))
             return asmt
 
-        # use up to min(10, len(answerdata)) threads to avoid overwhelming system
-        with ThreadPoolExecutor(max_workers=min(10, len(answerdata))) as executor:
-            futures = [executor.submit(process, asmt) for asmt in answerdata]
-            results = [f.result() for f in as_completed(futures)]
+        def next_timeout(now):
+            limits = []
+            if exam_deadline:
+                limits.append(run_started + exam_deadline - now)
+            if question_deadline:
+                with state_lock:
+                    for future in pending:
+                        began = started_at.get(id(futures[future]))
+                        # Not started yet: check again once it could have started
+                        limits.append(question_deadline if began is None else began + question_deadline - now)
+            return max(0, min(limits)) if limits else None
+
+        def missed_deadline(asmt, now):
+            if id(asmt) in finished:
+                return None
+            if exam_deadline and now - run_started >= exam_deadline:
+                return "exam"
+            began = started_at.get(id(asmt))
+            if question_deadline and began is not None and now - began >= question_deadline:
+                return "question"
+            return None
+
+        if not answerdata:
+            return
+
+        # use up to min(MAX_WORKERS, len(answerdata)) threads to avoid overwhelming system
+        executor = ThreadPoolExecutor(max_workers=min(max_workers or MAX_WORKERS, len(answerdata)))
+        run_started = time.perf_counter()
+        try:
+            futures = {scheduler.submit(executor, process, asmt, time.perf_counter()): asmt for asmt in answerdata}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=next_timeout(time.perf_counter()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+                now = time.perf_counter()
+                for future in list(pending):
+                    asmt = futures[future]
+                    with state_lock:
+                        missed = missed_deadline(asmt, now)
+                        if missed:
+                            expired.add(id(asmt))
+                            asmt["feedback"] = None
+                            asmt["status"] = "pending"
+                    if missed:
+                        pending.discard(future)
+                        future.cancel()
+                        metrics.DEADLINE_MISSES.inc(exam=exam_id, deadline=missed)
+                        yield asmt
+            metrics.EXAM_SECONDS.observe(time.perf_counter() - run_started, exam=exam_id)
+        finally:
+            # Drop queued work if the consumer stops early (e.g. the client disconnected)
+            # or deadlines expired; calls already in flight finish in the background.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def to_spec(self):
+        """
+        Compact JSON-serializable description of this executor (stored in GraderSpec).
+        The retrieved context is kept as text, so rebuilding needs no retrieval.
+        """
+        return {
+            "format": SPEC_FORMAT,
+            "exam_id": self.exam_id() or None,
+            "rubrics": self.rubrics_path,
+            "strictness": getattr(self, "strictness", 1),
+            "model": model_settings(),
+            "questions": [grader.to_spec() for grader in self.graders.values()],
+        }
+
+    @classmethod
+    def from_spec(cls, spec):
+        if spec.get("format") != SPEC_FORMAT:
+            raise ValueError(f"Unsupported grader spec format: {spec.get('format')}")
+        executor = cls.__new__(cls)
+        executor.rubrics_path = spec["rubrics"]
+        executor.strictness = spec.get("strictness", 1)
+        executor.graders = {}
+        for question in spec["questions"]:
+            grader = Grader.from_spec(spec["rubrics"], executor.strictness, spec.get("exam_id"), question)
+            executor.graders[grader.question] = grader
+        return executor
+
+    def matches(self, assessments, rubrics=None):
+        """
+        True if this executor was built for exactly these questions (text, weight,
+        minimum words and reference answer) and, when given, this rubric.
+        """
+        if rubrics is not None and rubrics != self.rubrics_path:
+            return False
+        built = sorted(
+            grader_fingerprint(g.question, g.overall_score, g.minimum_word_count, getattr(g, "reference_answer", None))
+            for g in self.graders.values()
+        )
+        return built == sorted(
+            grader_fingerprint(a.question, a.question_weight, a.min_words, getattr(a, "reference_answer", None))
+            for a in assessments
+        )
+
+    def exam_id(self):
+        for grader in self.graders.values():
+            return getattr(grader, "exam_id", None) or ""
+        return ""
+
+    def grade_batch(self, question_text, answer_texts, usage=None):
+        """
+        Grade many students' answers to one question with batched LLM requests.
+        Returns one feedback object (or None) per answer, in order.
+        """
+        grader = self.graders.get(question_text)
+        if grader is None:
+            return [None] * len(answer_texts)
+        return grader.grade_batch(answer_texts, usage=usage)
+
+    def grade_question_clustered(self, question_text, answer_texts, usage=None, similarity=None):
+        """
+        Grade many students' answers to one question by clustering near-duplicates:
+        one representative per cluster is graded (batched), and its result is copied
+        to the other members with "needs_review": True and "cluster_representative"
+        set to the representative's index in `answer_texts`.
+        Returns (results, report), results in the same order as `answer_texts`.
+        """
+        results = [None] * len(answer_texts)
+        report = {"answers": len(answer_texts), "short_circuited": 0, "clusters": 0, "propagated": 0}
+        grader = self.graders.get(question_text)
+        if grader is None:
+            return results, report
+
+        # Empty and far-too-short answers are decided by rules, never clustered
+        labels = grader.metric_labels()
+        candidates = []
+        for index, answer in enumerate(answer_texts):
+            results[index] = grader.apply_rules(answer)
+            if results[index] is None:
+                candidates.append(index)
+            else:
+                report["short_circuited"] += 1
+                metrics.ANSWERS.inc(outcome="short_circuit", **labels)
+        if not candidates:
+            return results, report
+
+        embeddings = encode_normalized([answer_texts[i] for i in candidates])
+        clusters = [
+            (candidates[representative], [candidates[m] for m in members])
+            for representative, members in cluster_embeddings(embeddings, similarity)
+        ]
+        graded = grader.grade_batch([answer_texts[representative] for representative, _ in clusters], usage=usage)
+
+        exam_id = self.exam_id()
+        for (representative, members), result in zip(clusters, graded):
+            results[representative] = result
+            for member in members:
+                if member == representative:
+                    continue
+                propagated = copy.deepcopy(result) if result is not None else None
+                if propagated is not None:
+                    propagated["needs_review"] = True
+                    propagated["cluster_representative"] = representative
+                results[member] = propagated
+                report["propagated"] += 1
+        report["clusters"] = len(clusters)
+        metrics.CLUSTERED_ANSWERS.inc(len(clusters), exam=exam_id, role="representative")
+        metrics.CLUSTERED_ANSWERS.inc(report["propagated"], exam=exam_id, role="propagated")
+        return results, report
 
-        return results
+    @staticmethod
+    def usage_report(results):
+        """
+        Token usage of a grade_exams() run, with cached and uncached prompt tokens split out,
+        how many answers were decided without an LLM call (rules.py and the reference
+        pre-grader) and how many of those carry a provisional score.
+        """
+        report = summarize_usage(asmt.get("token_usage") for asmt in results)
+        report["short_circuited_answers"] = sum(
+            1 for asmt in results if isinstance(asmt.get("feedback"), dict) and asmt["feedback"].get("short_circuit")
+        )
+        report["provisional_answers"] = sum(
+            1 for asmt in results if isinstance(asmt.get("feedback"), dict) and asmt["feedback"].get("provisional")
+        )
+        return report
@@ -5,49 +5,182 @@ from dotenv import load_dotenv
 import os
 from agno.tools.reasoning import ReasoningTools
 import json
+import time
+from threading import Lock
+from . import metrics
+from .rules import short_circuit
+from .pregrader import ReferencePreGrader, ENABLED as PREGRADE_ENABLED
+from .backends import get_backend
+from . import hedging
+from . import scheduler
+from . import routing
 
 
 
 BASEDIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASEDIR, '.env'))
 
+# Anthropic prompt caching: the system prompt is marked with a cache breakpoint
+# so repeated gradings of the same question only pay for the answer tokens.
+# With agno 2.x, cache_system_prompt sends the whole system message (our
+# instructions plus the ReasoningTools instructions) as one text block with
+# cache_control, so the cached prefix is the tool definitions and that block;
+# ANTHROPIC_EXTENDED_CACHE_TIME adds ttl "1h". Prompts shorter than the model's
+# minimum cacheable length are not cached at all.
+PROMPT_CACHE_ENABLED = os.getenv('ANTHROPIC_PROMPT_CACHE', 'true').lower() == 'true'
+PROMPT_CACHE_EXTENDED = os.getenv('ANTHROPIC_EXTENDED_CACHE_TIME', 'false').lower() == 'true'
+
+# Batch grading: several answers to one question in a single request. Batches
+# are capped by answer count, by an estimate of the answer tokens sent, and by
+# the output tokens the model may need for every result it returns.
+BATCH_MAX_SIZE = int(os.getenv('GRADER_BATCH_MAX_SIZE', '10'))
+BATCH_MAX_INPUT_TOKENS = int(os.getenv('GRADER_BATCH_MAX_INPUT_TOKENS', '8000'))
+BATCH_OUTPUT_TOKENS_PER_ANSWER = int(os.getenv('GRADER_BATCH_OUTPUT_TOKENS_PER_ANSWER', '600'))
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+# USD per million tokens, for cost reports. Defaults are Claude Sonnet list prices.
+TOKEN_PRICES = {
+    "input_tokens": float(os.getenv('ANTHROPIC_INPUT_PRICE_PER_MTOK', '3')),
+    "output_tokens": float(os.getenv('ANTHROPIC_OUTPUT_PRICE_PER_MTOK', '15')),
+    "cache_read_tokens": float(os.getenv('ANTHROPIC_CACHE_READ_PRICE_PER_MTOK', '0.3')),
+    "cache_write_tokens": float(os.getenv('ANTHROPIC_CACHE_WRITE_PRICE_PER_MTOK', '3.75')),
+}
+
+
+def empty_usage():
+    return dict.fromkeys(USAGE_FIELDS, 0)
+
+
+def estimate_tokens(text):
+    # Rough Anthropic-style estimate (~4 characters per token), good enough for sizing.
+    return len(text or "") // 4 + 1
+
+
+def summarize_usage(usages):
+    """
+    Sum per-call usage dicts and split prompt tokens into cached and uncached.
+    Anthropic reports input_tokens without the tokens served from or written to the cache.
+    """
+    total = empty_usage()
+    for usage in usages:
+        if not usage:
+            continue
+        for field in USAGE_FIELDS:
+            total[field] += usage.get(field, 0)
+
+    prompt_tokens = total["input_tokens"] + total["cache_read_tokens"] + total["cache_write_tokens"]
+    total["uncached_input_tokens"] = total["input_tokens"] + total["cache_write_tokens"]
+    total["cached_input_tokens"] = total["cache_read_tokens"]
+    total["cache_hit_ratio"] = round(total["cache_read_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+    return total
+
+
+def model_settings():
+    """
+    The model configuration graders currently run with (no credentials), recorded in grader specs.
+    """
+    def number(name, cast):
+        value = os.getenv(name)
+        return cast(value) if value else None
+
+    return {
+        "id": os.getenv('ANTHROPIC_MODEL'),
+        "small_id": routing.SMALL_MODEL if routing.ENABLED else None,
+        "max_tokens": number('ANTHROPIC_MAX_TOKENS', int),
+        "temperature": number('ANTHROPIC_TEMPERATURE', float),
+        "top_p": number('ANTHROPIC_TOP_P', float),
+        "prompt_cache": PROMPT_CACHE_ENABLED,
+        "extended_cache_time": PROMPT_CACHE_EXTENDED,
+    }
+
+
+def estimate_cost(usage):
+    """
+    Estimated USD cost of a usage dict (as filled by Grader or summarize_usage).
+    """
+    return round(sum((usage or {}).get(field, 0) * price for field, price in TOKEN_PRICES.items()) / 1_000_000, 6)
+
+
+_shared_models = {}
+_shared_models_lock = Lock()
+
+
+def shared_model(model_id=None):
+    """
+    One Claude client per distinct model configuration, shared by every grader in the process.
+    """
+    config = (
+        os.getenv('ANTHROPIC_API_KEY'),
+        model_id or os.getenv('ANTHROPIC_MODEL'),
+        int(os.getenv('ANTHROPIC_MAX_TOKENS')),
+        float(os.getenv('ANTHROPIC_TEMPERATURE')),
+        float(os.getenv('ANTHROPIC_TOP_P')),
+        PROMPT_CACHE_ENABLED,
+        PROMPT_CACHE_EXTENDED,
+    )
+    with _shared_models_lock:
+        model = _shared_models.get(config)
+        if model is None:
+            api_key, model_id, max_tokens, temperature, top_p, cache_prompt, extended_cache = config
+            model = Claude(
+                api_key=api_key,
+                id=model_id,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                cache_system_prompt=cache_prompt,
+                extended_cache_time=extended_cache
+            )
+            _shared_models[config] = model
+        return model
+
+
 class Grader:
 
-    def create_grader_agent(self):
+    def create_grader_agent(self, route=routing.LARGE):
+        # The system prompt is ordered from most to least shared so the provider
+        # can reuse it: exam-wide rules and rubrics first, then the per-question
+        # block. The student's answer only ever goes into the user message.
         return Agent(
-    model=Claude(
-        api_key=os.getenv('ANTHROPIC_API_KEY'),
-        id=os.getenv('ANTHROPIC_MODEL'),
-        max_tokens=int(os.getenv('ANTHROPIC_MAX_TOKENS')),
-        temperature=float(os.getenv('ANTHROPIC_TEMPERATURE')),
-        top_p=float(os.getenv('ANTHROPIC_TOP_P'))
-    ),
-    instructions=["You are a grader and you will be grading a student's answer.",
-                  "You will be provided with the rubrics for grading, context about the question and actual question",
-                  f"Here are the Rubrics:\n{self.rubrics}",
-                  f"Here is the question:{self.question}",
-                  f"Here is the context: {self.context}",
-                  f"The student's answer should be of minimum {self.minimum_word_count} words.",
-                  "Score each criterion separately on a scale of 0 to 1.",
-                  "Provide reasoning for each score.",
-                  f"If you deduct marks, explain why you deducted. For Example: Deducted marks for: \n 1. Deducted marks for not giving an example.\n 2. Deducted marks for grammatical mistakes"
-                  f"Compute the weighted final score out of {self.overall_score}.",
-                  "If something is wrong or missing, explain why.",
-                  self.leniency_description,
-                  "OUTPUT FORMAT RULES: ",
-                  "Return *only* a valid JSON object that starts with '{' and ends with '}'.",
-                  "Do not include markdown formatting, triple quotes, or backticks.",
-                  "Do not wrap the JSON inside any text, explanations, or comments.",
-                  "Do not say anything like 'Here is the JSON:' — just output the JSON directly.",
-                  f"The JSON must strictly follow the schema shown below: \n\n {self.output_format}"],
+    model=shared_model(routing.model_id(route)),
+    instructions=self.shared_instructions() + self.question_instructions(),
 
     tools=[
         ReasoningTools(add_instructions=True)
     ]
 )
 
+    def shared_instructions(self):
+        # Identical for every question of the exam and every student.
+        return ["You are a grader and you will be grading a student's answer.",
+                "You will be provided with the rubrics for grading, context about the question and actual question",
+                "Score each criterion separately on a scale of 0 to 1.",
+                "Provide reasoning for each score.",
+                "If you deduct marks, explain why you deducted. For Example: Deducted marks for: \n 1. Deducted marks for not giving an example.\n 2. Deducted marks for grammatical mistakes",
+                "If something is wrong or missing, explain why.",
+                self.leniency_description,
+                "OUTPUT FORMAT RULES: ",
+                "Return *only* a valid JSON object that starts with '{' and ends with '}'.",
+                "Do not include markdown formatting, triple quotes, or backticks.",
+                "Do not wrap the JSON inside any text, explanations, or comments.",
+                "Do not say anything like 'Here is the JSON:' — just output the JSON directly.",
+                f"The JSON must strictly follow the schema shown below: \n\n {self.output_format}",
+                f"Here are the Rubrics:\n{self.rubrics}"]
+
+    def question_instructions(self):
+        # Identical for every student answering this question.
+        return [f"Here is the question:{self.question}",
+                f"Here is the context: {self.context}",
+                f"The student's answer should be of minimum {self.minimum_word_count} words.",
+                f"Compute the weighted final score out of {self.overall_score}."]
+
+    def system_prompt(self):
+        return "\n".join(self.shared_instructions() + self.question_instructions())
+
     
-    def __init__(self, rubric_path, relevent_chunks, question, minimum_word_count, overall_score, strictness = 1):
+    def __init__(self, rubric_path, relevent_chunks, question, minimum_word_count, overall_score, strictness = 1,
+                 exam_id = None, question_id = None, reference_answer = None):
         
         # self.rubrics = generateRubrics.rubric_generation(os.path.join(os.path.dirname(BASEDIR), rubric_path))
         self.rubrics = rubric_path
@@ -57,6 +190,11 @@ class Grader:
         self.minimum_word_count = minimum_word_count
         self.overall_score = overall_score
         self.strictness = strictness
+        # Only used to tag metrics
+        self.exam_id = exam_id
+        self.question_id = question_id
+        # Optional model answer; close matches and clear misses skip the LLM
+        self.reference_answer = reference_answer
         self.output_format = '''
         {{
         "criteria": [
@@ -87,13 +225,90 @@ class Grader:
             f"they can still receive generous marks. "
             f"Apply this leniency consistently when scoring."
         )
-        self.agent = self.create_grader_agent()
+        # Agents (one per model route) are built on first use: most graders of a loaded
+        # exam are never called in a given process, and only the prompt inputs above get pickled.
+        self._agents = {}
+        self._agent_lock = Lock()
+        self._pregrader = None
+
+    @property
+    def agent(self):
+        return self.agent_for(routing.LARGE)
+
+    def agent_for(self, route):
+        agent = self._agents.get(route)
+        if agent is None:
+            with self._agent_lock:
+                agent = self._agents.get(route)
+                if agent is None:
+                    agent = self._agents[route] = self.create_grader_agent(route)
+        return agent
 
-    def grade_answer(self, answer):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_agents", None)
+        state.pop("_agent_lock", None)
+        state.pop("_pregrader", None)
+        return state
+
+    def __setstate__(self, state):
+        # Graders pickled before agents were lazy carry a full Agent; drop it.
+        state.pop("agent", None)
+        state.pop("_agent", None)
+        self.__dict__.update(state)
+        self._agents = {}
+        self._agent_lock = Lock()
+        self._pregrader = None
+
+    def to_spec(self):
+        # The per-question part of ExecuteGrader.to_spec(); prompt inputs only.
+        return {
+            "question_id": getattr(self, "question_id", None),
+            "question": self.question,
+            "question_weight": self.overall_score,
+            "min_words": self.minimum_word_count,
+            "context": self.context,
+            "reference_answer": getattr(self, "reference_answer", None),
+        }
+
+    @classmethod
+    def from_spec(cls, rubrics, strictness, exam_id, spec):
+        return cls(rubrics,
+                   spec.get("context"),
+                   spec["question"],
+                   spec["min_words"],
+                   spec["question_weight"],
+                   strictness=strictness,
+                   exam_id=exam_id,
+                   question_id=spec.get("question_id"),
+                   reference_answer=spec.get("reference_answer"))
+
+    @staticmethod
+    def count_words(answer):
         if answer == "" or answer == None or answer.lower() == "not answered":
-            word_count = 0
-        else:
-            word_count = len(answer.split())
+            return 0
+        return len(answer.split())
+
+    def metric_labels(self):
+        # Graders pickled before metrics existed have no ids
+        return {"exam": getattr(self, "exam_id", None) or "", "question": getattr(self, "question_id", None) or ""}
+
+    def grade_answer(self, answer, usage=None, pregrade=True, route=None):
+        # `usage`, when given, is filled with the token counts of every call made
+        # for this answer (retries included). `pregrade=False` skips the reference
+        # comparison for answers that already went through it. `route` forces a
+        # model route instead of choosing one from the answer (see routing.py).
+        labels = self.metric_labels()
+        started = time.perf_counter()
+        word_count = self.count_words(answer)
+        ruled = self.apply_rules(answer, word_count)
+        if ruled is not None:
+            metrics.ANSWERS.inc(outcome="short_circuit", **labels)
+            return ruled
+        provisional = self.pregrade([answer])[0] if pregrade else None
+        if provisional is not None:
+            metrics.ANSWERS.inc(outcome="provisional", **labels)
+            return provisional
         response_prompt = f'''Grade the following answer based on the provided rubrics, context, and question. 
         The word count of the answer is: {word_count}\n
         Answer:\n\n{answer}'''
@@ -104,18 +319,209 @@ class Grader:
 
         # return self.agent
         # return self.agent
-        response_json = self.convert_to_json(self.agent.run(response_prompt))
+        if route is None:
+            route = self.choose_route(word_count)
+        response_json = self.checked(self.convert_to_json(self.run_agent(response_prompt, usage, route)), route)
         i = 0
         while(response_json == None):
+            metrics.JSON_FAILURES.inc(**labels)
             if(i>=5):
                 print("Tried 5 times, yet it failed! Skipping question!")
                 break
-            response_json = self.convert_to_json(self.agent.run(response_prompt))
+            metrics.RETRIES.inc(**labels)
+            route = self.escalate(route)
+            response_json = self.checked(self.convert_to_json(self.run_agent(response_prompt, usage, route)), route)
             print("Object was on not a valid json! Retrying...")
             i += 1
 
+        metrics.ANSWER_SECONDS.observe(time.perf_counter() - started, **labels)
+        metrics.ANSWERS.inc(outcome="failed" if response_json is None else "graded", **labels)
         return response_json
 
+    def choose_route(self, word_count):
+        route, reason = routing.choose_route(self.overall_score, word_count)
+        metrics.ROUTES.inc(route=route, reason=reason)
+        return route
+
+    def checked(self, result, route):
+        # Small-model results must also pass validation, or they are graded again on the large model
+        if route == routing.SMALL and result is not None and not routing.valid_result(result, self.overall_score):
+            return None
+        return result
+
+    def escalate(self, route):
+        if route == routing.SMALL:
+            metrics.ESCALATIONS.inc(**self.metric_labels())
+        return routing.LARGE
+
+    def apply_rules(self, answer, word_count=None):
+        if word_count is None:
+            word_count = self.count_words(answer)
+        return short_circuit(answer, word_count, self.minimum_word_count, self.overall_score, self.rubrics)
+
+    def pregrade(self, answers):
+        """
+        Provisional results from the reference answer, None for each answer the LLM must grade.
+        """
+        reference_answer = getattr(self, "reference_answer", None)
+        if not PREGRADE_ENABLED or not reference_answer or not answers:
+            return [None] * len(answers)
+        if self._pregrader is None:
+            self._pregrader = ReferencePreGrader(reference_answer)
+        return self._pregrader.pregrade(answers, self.overall_score)
+
+    def batch_limit(self):
+        max_output_tokens = int(os.getenv('ANTHROPIC_MAX_TOKENS'))
+        return max(1, min(BATCH_MAX_SIZE, max_output_tokens // BATCH_OUTPUT_TOKENS_PER_ANSWER))
+
+    def plan_batches(self, answers):
+        """
+        Split answer indexes into batches that respect the count and token limits.
+        An answer too large for any batch is sent on its own.
+        """
+        limit = self.batch_limit()
+        batches, current, current_tokens = [], [], 0
+        for index, answer in enumerate(answers):
+            tokens = estimate_tokens(answer)
+            if current and (len(current) >= limit or current_tokens + tokens > BATCH_MAX_INPUT_TOKENS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def grade_batch(self, answers, usage=None):
+        """
+        Grade several students' answers to this question, one request per batch.
+        Returns results in the same order as `answers`. A batch whose response
+        cannot be parsed is graded again answer by answer.
+        """
+        labels = self.metric_labels()
+        results = [None] * len(answers)
+        pending = []
+        for index, answer in enumerate(answers):
+            results[index] = self.apply_rules(answer)
+            if results[index] is None:
+                pending.append(index)
+            else:
+                metrics.ANSWERS.inc(outcome="short_circuit", **labels)
+
+        provisional = self.pregrade([answers[i] for i in pending])
+        for index, result in zip(list(pending), provisional):
+            if result is not None:
+                results[index] = result
+                pending.remove(index)
+                metrics.ANSWERS.inc(outcome="provisional", **labels)
+
+        # Answers are batched with others on the same model route
+        by_route = {}
+        for index in pending:
+            by_route.setdefault(self.choose_route(self.count_words(answers[index])), []).append(index)
+        for route, route_pending in by_route.items():
+            for planned in self.plan_batches([answers[i] for i in route_pending]):
+                batch = [route_pending[i] for i in planned]
+                batch_answers = [answers[i] for i in batch]
+                for index, result in zip(batch, self.grade_planned_batch(batch_answers, usage, route)):
+                    results[index] = result
+        return results
+
+    def grade_planned_batch(self, batch_answers, usage, route):
+        labels = self.metric_labels()
+        if len(batch_answers) == 1:
+            return [self.grade_answer(batch_answers[0], usage, pregrade=False, route=route)]
+        batch_results = self.run_batch(batch_answers, usage, route)
+        if batch_results is None and route == routing.SMALL:
+            metrics.JSON_FAILURES.inc(**labels)
+            route = self.escalate(route)
+            batch_results = self.run_batch(batch_answers, usage, route)
+        if batch_results is None:
+            metrics.JSON_FAILURES.inc(**labels)
+            print("Batch response was not valid! Falling back to per-answer grading...")
+            return [self.grade_answer(answer, usage, pregrade=False, route=route) for answer in batch_answers]
+        metrics.ANSWERS.inc(len(batch_results), outcome="graded", **labels)
+        return batch_results
+
+    def run_batch(self, batch_answers, usage, route):
+        batch_results = self.convert_batch_to_json(
+            self.run_agent(self.batch_prompt(batch_answers), usage, route), len(batch_answers)
+        )
+        if batch_results is not None and any(self.checked(result, route) is None for result in batch_results):
+            return None
+        return batch_results
+
+    def batch_prompt(self, answers):
+        parts = [f'''Grade each of the following {len(answers)} answers independently, based on the provided rubrics, context, and question.
+        Each answer is from a different student; do not compare them with each other.
+        Return a single JSON object of the form {{"results": [...]}} where "results" is an array of exactly {len(answers)} objects,
+        in the same order as the answers. Each object must follow the schema above and add an "answer_id" field with the answer's number.''']
+        for answer_id, answer in enumerate(answers, start=1):
+            parts.append(f'''Answer {answer_id} (word count: {self.count_words(answer)}):\n\n{answer}''')
+        return "\n\n".join(parts)
+
+    def convert_batch_to_json(self, response, expected):
+        parsed = self.convert_to_json(response)
+        if not isinstance(parsed, dict):
+            return None
+        results = parsed.get("results")
+        if not isinstance(results, list) or len(results) != expected:
+            return None
+        if not all(isinstance(r, dict) and "total_score" in r for r in results):
+            return None
+        ordered = results
+        if all("answer_id" in r for r in results):
+            try:
+                by_id = {int(r.pop("answer_id")): r for r in results}
+            except (TypeError, ValueError):
+                return None
+            if sorted(by_id) != list(range(1, expected + 1)):
+                return None
+            ordered = [by_id[answer_id] for answer_id in range(1, expected + 1)]
+        for result in ordered:
+            result.pop("answer_id", None)
+        return ordered
+
+    def run_agent(self, prompt, usage=None, route=routing.LARGE):
+        backend = get_backend()
+        policy = hedging.get_policy()
+        if policy.enabled:
+            response = policy.run(
+                lambda: self.call_backend(backend, prompt, route),
+                backend.name,
+                self.metric_labels(),
+                on_discarded=lambda discarded: self.record_usage(discarded, route=route),
+                route=route,
+            )
+        else:
+            response = self.call_backend(backend, prompt, route)
+        self.record_usage(response, usage, route)
+        return response
+
+    def call_backend(self, backend, prompt, route=routing.LARGE):
+        # Call latency excludes the wait for a scheduler slot (the hedging delay is based on it)
+        labels = self.metric_labels()
+        with scheduler.get_scheduler().slot():
+            hedging.mark_started()
+            started = time.perf_counter()
+            try:
+                return backend.run(self, prompt, route)
+            finally:
+                metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - started, backend=backend.name, route=route, **labels)
+                metrics.LLM_CALLS.inc(backend=backend.name, route=route, **labels)
+
+    def record_usage(self, response, usage=None, route=routing.LARGE):
+        response_metrics = getattr(response, "metrics", None)
+        if response_metrics is None:
+            return
+        labels = self.metric_labels()
+        for field in USAGE_FIELDS:
+            count = getattr(response_metrics, field, 0) or 0
+            if count:
+                metrics.TOKENS.inc(count, kind=field, route=route, **labels)
+            if usage is not None:
+                usage[field] = usage.get(field, 0) + count
+
 
     def convert_to_json(self, response):
         try:
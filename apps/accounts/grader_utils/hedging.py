@@ -0,0 +1,118 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar
+from threading import Event
+import os
+
+from . import metrics
+from . import scheduler
+
+
+# Hedged LLM requests: if a call has not returned after the recent p95 call
+# latency, send the same request once more and use whichever answer comes back
+# first. This trades a few extra calls for a much shorter latency tail. The
+# delay counts from when the call holds its scheduler slot (mark_started()),
+# not from when it was queued for a thread or a slot, so a busy pool or a
+# saturated scheduler does not turn every call into two. While requests are
+# waiting for slots no hedge is sent at all: it would only queue behind them.
+
+_started = ContextVar("hedged_call_started", default=None)
+
+
+def mark_started():
+    """
+    Called by a hedged call once it holds its scheduler slot. A call that never
+    calls it is not hedged.
+    """
+    event = _started.get()
+    if event is not None:
+        event.set()
+
+
+class HedgePolicy:
+
+    def __init__(self, enabled=None, quantile=None, min_delay=None, min_samples=None, max_workers=None):
+        self.enabled = (enabled if enabled is not None
+                        else os.getenv('GRADER_HEDGE', 'false').lower() == 'true')
+        self.quantile = float(quantile if quantile is not None else os.getenv('GRADER_HEDGE_QUANTILE', '0.95'))
+        # Used until enough calls have been observed, and as a floor afterwards
+        self.min_delay = float(min_delay if min_delay is not None else os.getenv('GRADER_HEDGE_MIN_DELAY', '2'))
+        self.min_samples = int(min_samples if min_samples is not None else os.getenv('GRADER_HEDGE_MIN_SAMPLES', '20'))
+        # Hedged calls run on their own pool so a slow call never blocks its duplicate
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(max_workers if max_workers is not None else os.getenv('GRADER_HEDGE_MAX_WORKERS', '64')),
+            thread_name_prefix="grader-hedge",
+        )
+
+    def delay(self, backend_name, route=None):
+        # Models on different routes have different latencies
+        labels = {"backend": backend_name}
+        if route is not None:
+            labels["route"] = route
+        recent = metrics.LLM_CALL_SECONDS.recent(**labels)
+        if len(recent) < self.min_samples:
+            return self.min_delay
+        return max(self.min_delay, metrics.quantile(recent, self.quantile))
+
+    def run(self, call, backend_name, labels, on_discarded=None, route=None):
+        """
+        Run `call()` with at most one hedge. `on_discarded(response)` receives the
+        response that lost the race, so its tokens can still be accounted for.
+        """
+        started = Event()
+        primary = scheduler.submit(self.executor, self.started_call(call, started))
+        primary.add_done_callback(lambda f: started.set())
+        started.wait()
+        done, _ = wait([primary], timeout=self.delay(backend_name, route))
+        if done or self.scheduler_busy():
+            return primary.result()
+
+        metrics.HEDGES.inc(**labels)
+        hedge = scheduler.submit(self.executor, call)
+        pending = {primary, hedge}
+        winner = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [f for f in done if f.exception() is None]
+            if succeeded:
+                winner = hedge if hedge in succeeded else primary
+                break
+        if winner is None:
+            # Both failed; surface the original error
+            return primary.result()
+
+        if winner is hedge:
+            metrics.HEDGE_WINS.inc(**labels)
+        loser = primary if winner is hedge else hedge
+        if on_discarded is not None:
+            loser.add_done_callback(lambda f: f.exception() is None and on_discarded(f.result()))
+        return winner.result()
+
+    @staticmethod
+    def started_call(call, started):
+        # Runs in the context copied by scheduler.submit, so each call sees its own event
+        def run():
+            _started.set(started)
+            return call()
+        return run
+
+    @staticmethod
+    def scheduler_busy():
+        return any(scheduler.get_scheduler().stats()["waiting"].values())
+
+
+policy = HedgePolicy()
+
+
+def get_policy():
+    return policy
+
+
+def set_policy(new_policy):
+    """
+    Swap the process-wide hedging policy (benchmarks, management commands).
+    Returns the previous one.
+    """
+    global policy
+    previous = policy
+    policy = new_policy
+    return previous
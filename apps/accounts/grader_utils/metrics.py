@@ -0,0 +1,254 @@
+from collections import OrderedDict, deque
+from threading import Lock
+import json
+import math
+import os
+
+
+# Minimal in-process metrics for the grading path. Values live for the life of
+# the process and are exported by GradingMetricsView in the Prometheus text
+# format (or as JSON), so they can be scraped per worker.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+# Sub-millisecond to 100ms, for cheap per-request checks such as throttling.
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 5000, 10000)
+# Recent observations kept per label set, for quantiles such as the hedging delay.
+RECENT_SAMPLES = 1024
+# Label sets kept per metric; the least recently updated one is dropped beyond
+# this, so metrics labelled by exam do not grow for the life of the process.
+MAX_SERIES = int(os.getenv('GRADER_METRICS_MAX_SERIES', '500'))
+# Lets a scraper read GradingMetricsView with "Authorization: Bearer <token>"
+# instead of a professor token (unset = professors only).
+METRICS_TOKEN = os.getenv('GRADER_METRICS_TOKEN') or None
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = OrderedDict()
+        self._lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+            self._values.move_to_end(key)
+            _evict(self._values)
+
+    def value(self, **labels):
+        with self._lock:
+            if labels:
+                return self._values.get(_label_key(self.labelnames, labels), 0)
+            return sum(self._values.values())
+
+    def samples(self):
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = []
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+    def to_dict(self):
+        return [{"labels": labels, "value": value} for labels, value in self.samples()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = OrderedDict()
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "counts": [0] * len(self.buckets),
+                    "count": 0,
+                    "sum": 0.0,
+                    "recent": deque(maxlen=RECENT_SAMPLES),
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["count"] += 1
+            series["sum"] += value
+            series["recent"].append(value)
+            self._series.move_to_end(key)
+            _evict(self._series)
+
+    def recent(self, **labels):
+        """
+        Recent observations of every label set matching the given labels
+        (all of them when no labels are given).
+        """
+        wanted = {name: str(value) for name, value in labels.items()}
+        with self._lock:
+            values = []
+            for key, series in self._series.items():
+                series_labels = dict(zip(self.labelnames, key))
+                if all(series_labels.get(name) == value for name, value in wanted.items()):
+                    values.extend(series["recent"])
+            return values
+
+    def quantile(self, q, **labels):
+        return quantile(self.recent(**labels), q)
+
+    def samples(self):
+        with self._lock:
+            return [
+                (dict(zip(self.labelnames, key)), list(s["counts"]), s["count"], s["sum"], list(s["recent"]))
+                for key, s in self._series.items()
+            ]
+
+    def render(self):
+        lines = []
+        for labels, counts, count, total, _ in self.samples():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+    def to_dict(self):
+        return [
+            {
+                "labels": labels,
+                "count": count,
+                "sum": round(total, 6),
+                "p50": quantile(recent, 0.50),
+                "p95": quantile(recent, 0.95),
+                "p99": quantile(recent, 0.99),
+            }
+            for labels, counts, count, total, recent in self.samples()
+        ]
+
+
+def quantile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _evict(series):
+    while len(series) > MAX_SERIES:
+        series.popitem(last=False)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+REGISTRY = {}
+
+
+def _register(metric):
+    REGISTRY[metric.name] = metric
+    return metric
+
+
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    return {name: metric.to_dict() for name, metric in REGISTRY.items()}
+
+
+def render_json():
+    return json.dumps(snapshot())
+
+
+# -------------------------------------------------------------------
+# Grading metrics
+# -------------------------------------------------------------------
+# Histograms are not labelled by question: each label set keeps RECENT_SAMPLES values
+LLM_CALL_SECONDS = _register(Histogram(
+    "grader_llm_call_seconds", "Wall time of one LLM request, by model route.", ("exam", "backend", "route")))
+LLM_CALLS = _register(Counter(
+    "grader_llm_calls_total", "LLM requests sent, by model route.", ("exam", "question", "backend", "route")))
+TOKENS = _register(Counter(
+    "grader_tokens_total", "Tokens reported by the model, by kind and model route.", ("exam", "question", "kind", "route")))
+ANSWER_SECONDS = _register(Histogram(
+    "grader_answer_seconds", "Wall time to grade one answer, retries included.", ("exam",)))
+ANSWERS = _register(Counter(
+    "grader_answers_total", "Answers graded, by outcome (graded, failed, short_circuit, provisional).", ("exam", "question", "outcome")))
+RETRIES = _register(Counter(
+    "grader_retries_total", "LLM requests repeated because the previous response was not valid JSON.", ("exam", "question")))
+JSON_FAILURES = _register(Counter(
+    "grader_json_failures_total", "LLM responses that could not be parsed.", ("exam", "question")))
+QUEUE_WAIT_SECONDS = _register(Histogram(
+    "grader_queue_wait_seconds", "Time an answer waited for a grading thread.", ("exam",)))
+EXAM_SECONDS = _register(Histogram(
+    "grader_exam_seconds", "Wall time to grade one submission.", ("exam",)))
+RULE_HITS = _register(Counter(
+    "grader_rule_hits_total", "LLM calls avoided by deterministic rules.", ("rule",)))
+HEDGES = _register(Counter(
+    "grader_hedged_requests_total", "Duplicate LLM requests sent because the first one was slow.", ("exam", "question")))
+HEDGE_WINS = _register(Counter(
+    "grader_hedge_wins_total", "Hedged requests that returned before the original.", ("exam", "question")))
+DEADLINE_MISSES = _register(Counter(
+    "grader_deadline_misses_total", "Answers returned as pending because grading missed its deadline.", ("exam", "deadline")))
+CONTEXT_TOKENS = _register(Histogram(
+    "grader_context_tokens", "Estimated tokens of the retrieved context built for one question.", (), TOKEN_BUCKETS))
+PREGRADES = _register(Counter(
+    "grader_pregrades_total", "Answers compared with a reference answer, by band (match, mismatch, ambiguous).", ("band",)))
+CLUSTERED_ANSWERS = _register(Counter(
+    "grader_clustered_answers_total", "Answers graded in clustered mode, by role (representative, propagated).", ("exam", "role")))
+REGISTRY_LOOKUPS = _register(Counter(
+    "grader_registry_lookups_total", "Loaded-grader registry lookups, by result (hit, miss).", ("result",)))
+REGISTRY_EVICTIONS = _register(Counter(
+    "grader_registry_evictions_total", "Graders evicted from the loaded-grader registry."))
+SCHEDULER_WAIT_SECONDS = _register(Histogram(
+    "grader_scheduler_wait_seconds", "Time an LLM request waited for a slot, by priority class.", ("priority",)))
+SCHEDULER_GRANTS = _register(Counter(
+    "grader_scheduler_grants_total", "LLM slots granted, by priority class and reason (free, fair, starvation, fifo).", ("priority", "reason")))
+ROUTES = _register(Counter(
+    "grader_routes_total", "Answers routed to a model, by route (small, large) and reason.", ("route", "reason")))
+ESCALATIONS = _register(Counter(
+    "grader_escalations_total", "Small-model results that failed validation and were graded again on the large model.", ("exam", "question")))
+ADMISSIONS = _register(Counter(
+    "grader_admissions_total", "Synchronous grading requests by outcome (admitted, rejected_in_flight, rejected_backlog).", ("priority", "outcome")))
+
+
+# -------------------------------------------------------------------
+# Request metrics
+# -------------------------------------------------------------------
+THROTTLE_DECISIONS = _register(Counter(
+    "api_throttle_decisions_total", "Rate-limit checks on expensive endpoints, by scope and outcome (allowed, throttled).", ("scope", "outcome")))
+THROTTLE_SECONDS = _register(Histogram(
+    "api_throttle_check_seconds", "Time spent deciding one rate-limit check.", ("scope",), FAST_BUCKETS))
+AUTH_LOOKUPS = _register(Counter(
+    "api_auth_lookups_total", "Token lookups by result (hit: cached, miss: queried, invalid: unknown token).", ("result",)))
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+from . import metrics
+from .rules import scored_result
+
+
+# Pre-grading against a professor-written reference answer. Student answers are
+# embedded with the same MiniLM model used for retrieval and compared to the
+# reference by cosine similarity. Answers that are clearly right (at or above
+# HIGH_SIMILARITY) or clearly off-topic (at or below LOW_SIMILARITY) get a
+# provisional score without an LLM call; everything in between is graded as usual.
+
+ENABLED = os.getenv('GRADER_PREGRADE', 'true').lower() == 'true'
+HIGH_SIMILARITY = float(os.getenv('GRADER_PREGRADE_HIGH', '0.9'))
+LOW_SIMILARITY = float(os.getenv('GRADER_PREGRADE_LOW', '0.2'))
+
+
+class ReferencePreGrader:
+
+    def __init__(self, reference_answer, high=None, low=None):
+        self.reference_answer = reference_answer
+        self.high = HIGH_SIMILARITY if high is None else high
+        self.low = LOW_SIMILARITY if low is None else low
+        self._reference_embedding = None
+
+    def reference_embedding(self):
+        if self._reference_embedding is None:
+            from .embeddings import encode_normalized
+            self._reference_embedding = encode_normalized([self.reference_answer])[0]
+        return self._reference_embedding
+
+    def similarities(self, answers):
+        """
+        Cosine similarity of every answer to the reference, in one encode call.
+        """
+        if not answers:
+            return np.zeros(0, dtype=np.float32)
+        from .embeddings import encode_normalized
+        return encode_normalized(answers) @ self.reference_embedding()
+
+    def pregrade(self, answers, overall_score):
+        """
+        Return one provisional result per answer, or None where the LLM must decide.
+        """
+        results = []
+        for similarity in self.similarities(answers):
+            similarity = round(float(similarity), 4)
+            if similarity >= self.high:
+                band = "match"
+                result = scored_result(
+                    "Matches the reference answer",
+                    f"Provisional score: the answer closely matches the reference answer (similarity {similarity:.2f}).",
+                    1,
+                    overall_score,
+                    "reference_match",
+                )
+            elif similarity <= self.low:
+                band = "mismatch"
+                result = scored_result(
+                    "Matches the reference answer",
+                    f"Provisional score: the answer does not address the reference answer (similarity {similarity:.2f}).",
+                    0,
+                    overall_score,
+                    "reference_mismatch",
+                )
+            else:
+                band = "ambiguous"
+                result = None
+            metrics.PREGRADES.inc(band=band)
+            if result is not None:
+                result["provisional"] = True
+                result["similarity"] = similarity
+            results.append(result)
+        return results
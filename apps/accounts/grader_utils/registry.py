@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from threading import Lock
+import os
+
+from . import metrics
+
+
+# Per-process cache of loaded ExecuteGrader objects, so grading many submissions
+# of one exam does not load the saved grader again for every request. Entries
+# are keyed by exam id and carry the version they were loaded at; a lookup
+# with a different version (the grader was rebuilt) loads it again. The least
+# recently used entries are evicted beyond MAX_ENTRIES graders or MAX_BYTES of
+# serialized size, which is used as the memory estimate.
+
+MAX_ENTRIES = int(os.getenv('GRADER_REGISTRY_MAX_ENTRIES', '32'))
+MAX_BYTES = int(os.getenv('GRADER_REGISTRY_MAX_BYTES', str(256 * 1024 * 1024)))
+# Loads of exams sharing a stripe wait for each other; a fixed number keeps the
+# locks from growing with every exam ever loaded
+LOAD_LOCK_STRIPES = int(os.getenv('GRADER_REGISTRY_LOAD_LOCKS', '64'))
+
+
+class GraderRegistry:
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        # exam_id -> (version, executor, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        # Striped by exam id so concurrent misses load a grader only once
+        self._load_locks = [Lock() for _ in range(max(1, LOAD_LOCK_STRIPES))]
+
+    def get(self, exam_id, version, loader):
+        """
+        Return the cached executor for (exam_id, version), or call `loader()`,
+        which must return (executor, size_in_bytes), and cache its result.
+        """
+        cached = self._lookup(exam_id, version)
+        if cached is not None:
+            return cached
+
+        load_lock = self._load_locks[hash(exam_id) % len(self._load_locks)]
+        with load_lock:
+            cached = self._lookup(exam_id, version)
+            if cached is not None:
+                return cached
+            metrics.REGISTRY_LOOKUPS.inc(result="miss")
+            executor, size = loader()
+            self._store(exam_id, version, executor, size)
+            return executor
+
+    def _lookup(self, exam_id, version):
+        with self._lock:
+            entry = self._entries.get(exam_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(exam_id)
+        metrics.REGISTRY_LOOKUPS.inc(result="hit")
+        return entry[1]
+
+    def _store(self, exam_id, version, executor, size):
+        with self._lock:
+            self._discard(exam_id)
+            if size > self.max_bytes:
+                # Larger than the whole budget: serve it, don't keep it
+                return
+            self._entries[exam_id] = (version, executor, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted = next(iter(self._entries))
+                self._discard(evicted)
+                metrics.REGISTRY_EVICTIONS.inc()
+
+    def _discard(self, exam_id):
+        entry = self._entries.pop(exam_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def invalidate(self, exam_id):
+        with self._lock:
+            self._discard(exam_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+registry = GraderRegistry()
@@ -0,0 +1,58 @@
+import os
+
+
+# Model routing: short answers and low-weight questions are graded by a smaller,
+# faster model (ANTHROPIC_SMALL_MODEL), everything else by ANTHROPIC_MODEL.
+# A small-model response that fails validation is graded again on the large
+# model. Routing is off while ANTHROPIC_SMALL_MODEL is unset.
+
+SMALL = "small"
+LARGE = "large"
+
+SMALL_MODEL = os.getenv('ANTHROPIC_SMALL_MODEL') or None
+ENABLED = bool(SMALL_MODEL) and os.getenv('GRADER_ROUTING', 'true').lower() == 'true'
+# Answers of at most this many words go to the small model
+SHORT_ANSWER_WORDS = int(os.getenv('GRADER_ROUTE_SHORT_ANSWER_WORDS', '120'))
+# Questions worth at most this much go to the small model, whatever the answer length
+LOW_WEIGHT = float(os.getenv('GRADER_ROUTE_LOW_WEIGHT', '2'))
+# Accepted overshoot of total_score over the question weight (rounding in the model's sums)
+SCORE_TOLERANCE = float(os.getenv('GRADER_ROUTE_SCORE_TOLERANCE', '0.01'))
+
+
+def model_id(route):
+    if route == SMALL and SMALL_MODEL:
+        return SMALL_MODEL
+    return os.getenv('ANTHROPIC_MODEL')
+
+
+def choose_route(question_weight, word_count):
+    """
+    (route, reason) for one answer of `word_count` words to a question worth `question_weight`.
+    """
+    if not ENABLED:
+        return LARGE, "disabled"
+    try:
+        if float(question_weight) <= LOW_WEIGHT:
+            return SMALL, "low_weight"
+    except (TypeError, ValueError):
+        pass
+    if word_count <= SHORT_ANSWER_WORDS:
+        return SMALL, "short_answer"
+    return LARGE, "default"
+
+
+def valid_result(result, out_of):
+    """
+    True if a parsed grading result has criteria and a numeric total within [0, out_of].
+    """
+    if not isinstance(result, dict) or not isinstance(result.get("criteria"), list):
+        return False
+    total = result.get("total_score")
+    if not isinstance(total, dict):
+        return False
+    try:
+        score = float(total.get("result"))
+        limit = float(out_of)
+    except (TypeError, ValueError):
+        return False
+    return 0 <= score <= limit * (1 + SCORE_TOLERANCE)
@@ -0,0 +1,107 @@
+from functools import lru_cache
+import os
+import re
+
+from . import metrics
+
+
+# Deterministic checks that run before the LLM. When a rule matches, the answer
+# gets a zero-score result in the grader's output schema and no request is made.
+
+# An answer counts as "far below" the minimum when it has fewer than
+# min_words * ratio words.
+MIN_WORDS_ZERO_RATIO = float(os.getenv('GRADER_MIN_WORDS_ZERO_RATIO', '0.25'))
+# 'auto' applies the word-count rule only when the rubric asks for it,
+# 'always' / 'never' override the rubric.
+ENFORCE_MIN_WORDS = os.getenv('GRADER_ENFORCE_MIN_WORDS', 'auto').lower()
+
+NOT_ANSWERED = {"", "not answered"}
+
+_SENTENCE_SPLIT = re.compile(r"[\n.;]+")
+_MENTIONS_LENGTH = re.compile(r"\b(minimum|min\.?|at least|fewer than|less than|below|under|short of)\b.*\bwords?\b|\bwords?\b.*\b(minimum|limit|count)\b", re.IGNORECASE)
+_MENTIONS_ZERO = re.compile(r"\b(zero|no)\s+(marks?|points?|credit|score)\b|\b0\s*(marks?|points?|credit|%)|\bscore\s+of\s+0\b|\bwill\s+(fail|not\s+be\s+graded)\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def rubric_enforces_min_words(rubrics):
+    """
+    True if one sentence of the rubric ties the minimum word count to a zero score,
+    e.g. "Answers below the minimum word count receive 0 marks."
+    """
+    if ENFORCE_MIN_WORDS == "always":
+        return True
+    if ENFORCE_MIN_WORDS == "never" or not rubrics:
+        return False
+    return any(
+        _MENTIONS_LENGTH.search(sentence) and _MENTIONS_ZERO.search(sentence)
+        for sentence in _SENTENCE_SPLIT.split(rubrics)
+    )
+
+
+def short_circuit(answer, word_count, minimum_word_count, overall_score, rubrics):
+    """
+    Return a zero-score result if a rule decides the answer without the LLM, else None.
+    """
+    if answer is None or answer.strip().lower() in NOT_ANSWERED:
+        return _record("empty_answer", zero_score_result(
+            "Answer provided",
+            "No answer was submitted.",
+            overall_score,
+            "empty_answer",
+        ))
+
+    if (minimum_word_count
+            and word_count < minimum_word_count * MIN_WORDS_ZERO_RATIO
+            and rubric_enforces_min_words(rubrics)):
+        return _record("below_min_words", zero_score_result(
+            "Minimum word count",
+            f"The answer has {word_count} words, far below the required minimum of {minimum_word_count}. "
+            "The rubric awards no marks for answers this short.",
+            overall_score,
+            "below_min_words",
+        ))
+
+    return None
+
+
+def zero_score_result(criterion, feedback, overall_score, rule):
+    return scored_result(criterion, feedback, 0, overall_score, rule)
+
+
+def scored_result(criterion, feedback, score, overall_score, rule):
+    """
+    A single-criterion result in the grader's output schema. `score` is the
+    fraction of the criterion awarded, from 0 to 1.
+    """
+    total = round(score * float(overall_score or 0), 2) if score else 0
+    return {
+        "criteria": [
+            {
+                "criterion": criterion,
+                "weight": 1,
+                "feedback": feedback,
+                "score_received": score,
+                "result_calculation": f"{score} * 1",
+                "result": score,
+            }
+        ],
+        "total_score": {
+            "calculation": str(total),
+            "result": total,
+            "out_of": overall_score,
+        },
+        "overall_feedback": feedback,
+        "short_circuit": rule,
+    }
+
+
+def _record(rule, result):
+    metrics.RULE_HITS.inc(rule=rule)
+    return result
+
+
+def rule_hit_counts():
+    """
+    Number of LLM calls avoided by each rule since the process started.
+    """
+    return {labels["rule"]: count for labels, count in metrics.RULE_HITS.samples()}
@@ -0,0 +1,231 @@
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from threading import Condition, Lock
+import os
+import time
+
+from . import metrics
+
+
+# Every LLM request takes one of SLOTS per-process slots. When all are busy,
+# waiting requests are served by priority class and, within a class, round-robin
+# by tenant (a professor or a course), so one professor's bulk regrade cannot
+# queue a single interactive submission behind thousands of answers:
+#   interactive  a person is waiting on the result (one submission)
+#   bulk         whole-exam grading runs
+#   background   work nobody is waiting on (rebuilds, re-embedding)
+# Classes share the slots in proportion to their WEIGHTS (stride scheduling).
+# A request that has waited STARVATION_SECONDS is served next regardless of
+# its class, so lower classes keep moving under sustained interactive load.
+#
+# SLOTS is a per-process limit, not a global one: every web worker and every
+# run_workers process has its own SLOTS. Set GRADER_LLM_SLOTS to the provider
+# concurrency you can afford divided by the number of grading processes.
+
+PRIORITIES = ("interactive", "bulk", "background")
+# Per process; 0 disables the scheduler (no limit on concurrent LLM requests)
+SLOTS = int(os.getenv('GRADER_LLM_SLOTS', '16'))
+WEIGHTS = {
+    "interactive": float(os.getenv('GRADER_WEIGHT_INTERACTIVE', '16')),
+    "bulk": float(os.getenv('GRADER_WEIGHT_BULK', '4')),
+    "background": float(os.getenv('GRADER_WEIGHT_BACKGROUND', '1')),
+}
+STARVATION_SECONDS = float(os.getenv('GRADER_STARVATION_SECONDS', '30'))
+# "fair" (the above) or "fifo" (first come, first served; for comparison)
+POLICY = os.getenv('GRADER_SCHEDULER_POLICY', 'fair').lower()
+# Tenant that fair sharing is computed over: "professor" or "course"
+FAIR_SHARE = os.getenv('GRADER_FAIR_SHARE', 'professor').lower()
+
+_current = ContextVar("grader_priority", default=("bulk", ""))
+
+
+def tenant_key(course):
+    if FAIR_SHARE == "course":
+        return f"course:{course.id}"
+    return f"professor:{course.professor_id}"
+
+
+@contextmanager
+def priority(name, tenant=""):
+    """
+    Run LLM requests made inside the block (on this thread, or on threads
+    started with submit()) at the given priority class, on behalf of `tenant`.
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {name}")
+    token = _current.set((name, str(tenant)))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_priority():
+    return _current.get()
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    executor.submit() that carries the caller's priority over to the worker thread.
+    """
+    return executor.submit(copy_context().run, fn, *args, **kwargs)
+
+
+class _Waiter:
+    __slots__ = ("priority", "tenant", "enqueued_at", "granted")
+
+    def __init__(self, priority_name, tenant):
+        self.priority = priority_name
+        self.tenant = tenant
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class SlotScheduler:
+
+    def __init__(self, slots=None, weights=None, starvation_seconds=None, policy=None):
+        self.slots = SLOTS if slots is None else slots
+        self.weights = {**WEIGHTS, **(weights or {})}
+        self.starvation_seconds = STARVATION_SECONDS if starvation_seconds is None else starvation_seconds
+        self.policy = POLICY if policy is None else policy
+        if self.policy not in ("fair", "fifo"):
+            raise ValueError(f"Unknown scheduler policy: {self.policy}")
+        self._cond = Condition(Lock())
+        self._in_use = 0
+        # priority -> tenant -> waiters in arrival order; tenants are served round-robin
+        self._queues = {name: OrderedDict() for name in PRIORITIES}
+        # Stride scheduling: each grant advances its class by 1 / weight
+        self._pass = dict.fromkeys(PRIORITIES, 0.0)
+        self._clock = 0.0
+
+    @contextmanager
+    def slot(self, priority_name=None, tenant=None):
+        if priority_name is None:
+            priority_name, default_tenant = current_priority()
+            tenant = default_tenant if tenant is None else tenant
+        tenant = "" if tenant is None else str(tenant)
+        if self.slots <= 0:
+            yield
+            return
+
+        self.acquire(priority_name, tenant)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, priority_name, tenant=""):
+        waiter = _Waiter(priority_name, tenant)
+        with self._cond:
+            if self._in_use < self.slots and not self._waiting():
+                self._in_use += 1
+                metrics.SCHEDULER_GRANTS.inc(priority=priority_name, reason="free")
+                metrics.SCHEDULER_WAIT_SECONDS.observe(0.0, priority=priority_name)
+                return
+            tenants = self._queues[priority_name]
+            if not tenants:
+                # A class that was idle does not bank credit for the time it was idle
+                self._pass[priority_name] = max(self._pass[priority_name], self._clock)
+            tenants.setdefault(tenant, deque()).append(waiter)
+            try:
+                while not waiter.granted:
+                    self._cond.wait()
+            except BaseException:
+                if waiter.granted:
+                    self._in_use -= 1
+                else:
+                    self._remove(waiter)
+                self._dispatch()
+                raise
+        metrics.SCHEDULER_WAIT_SECONDS.observe(time.monotonic() - waiter.enqueued_at, priority=priority_name)
+
+    def release(self):
+        with self._cond:
+            self._in_use -= 1
+            self._dispatch()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "in_use": self._in_use,
+                "policy": self.policy,
+                "waiting": {
+                    name: sum(len(waiters) for waiters in tenants.values())
+                    for name, tenants in self._queues.items()
+                },
+            }
+
+    def _waiting(self):
+        return any(self._queues.values())
+
+    def _dispatch(self):
+        granted = False
+        while self._in_use < self.slots and self._waiting():
+            waiter, reason = self._next_waiter()
+            waiter.granted = True
+            self._in_use += 1
+            granted = True
+            metrics.SCHEDULER_GRANTS.inc(priority=waiter.priority, reason=reason)
+        if granted:
+            self._cond.notify_all()
+
+    def _heads(self):
+        for tenants in self._queues.values():
+            for waiters in tenants.values():
+                yield waiters[0]
+
+    def _next_waiter(self):
+        oldest = min(self._heads(), key=lambda w: w.enqueued_at)
+        if self.policy == "fifo":
+            self._remove(oldest)
+            return oldest, "fifo"
+        if time.monotonic() - oldest.enqueued_at >= self.starvation_seconds:
+            self._remove(oldest)
+            return oldest, "starvation"
+
+        priority_name = min(
+            (name for name in PRIORITIES if self._queues[name]),
+            key=lambda name: (self._pass[name], PRIORITIES.index(name)),
+        )
+        self._clock = self._pass[priority_name]
+        self._pass[priority_name] += 1 / max(self.weights[priority_name], 1e-9)
+        tenants = self._queues[priority_name]
+        tenant, waiters = next(iter(tenants.items()))
+        waiter = waiters.popleft()
+        # Round-robin: the tenant just served goes to the back
+        del tenants[tenant]
+        if waiters:
+            tenants[tenant] = waiters
+        return waiter, "fair"
+
+    def _remove(self, waiter):
+        tenants = self._queues[waiter.priority]
+        waiters = tenants.get(waiter.tenant)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        if not waiters:
+            del tenants[waiter.tenant]
+
+
+scheduler = SlotScheduler()
+
+
+def get_scheduler():
+    return scheduler
+
+
+def set_scheduler(new_scheduler):
+    """
+    Swap the process-wide scheduler (benchmarks, management commands).
+    Returns the previous one.
+    """
+    global scheduler
+    previous = scheduler
+    scheduler = new_scheduler
+    return previous
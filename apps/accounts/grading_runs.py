@@ -0,0 +1,261 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from threading import Lock
+import os
+import time
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .grader_utils import scheduler
+from .grader_utils.execute_grader import MAX_WORKERS
+from .grader_utils.grader import empty_usage, estimate_cost, summarize_usage, USAGE_FIELDS
+from .jobs import enqueue
+from .models import GradingRun, StudentAnswer, StudentExamSubmission
+
+
+# "Grade the whole exam": every ungraded StudentAnswer of an exam is graded in
+# one run. All submissions share one pool of MAX_WORKERS concurrent requests;
+# answers to the same question are sent in batches. Each result is saved as
+# soon as it arrives, so a run that is interrupted can be resumed by starting
+# a new one, which only picks up the answers that are still ungraded.
+# Runs send their LLM requests at "bulk" priority (grader_utils/scheduler.py),
+# so professors grading a single submission are not queued behind them.
+# A "clustered" run grades each question's answers together, sending only one
+# representative of each group of near-identical answers to the LLM; the copied
+# results are saved with needs_review set.
+
+# A "running" run that has not sent a heartbeat for this long is treated as
+# dead (e.g. its process was killed) and may be replaced.
+STALE_SECONDS = int(os.getenv('GRADING_RUN_STALE_SECONDS', '300'))
+# How often a run records that it is alive while batches are in flight; must be
+# well below STALE_SECONDS and the job visibility timeout.
+HEARTBEAT_SECONDS = float(os.getenv('GRADING_RUN_HEARTBEAT_SECONDS', '30'))
+# Counts kept in GradingRun.clustering (see ExecuteGrader.grade_question_clustered)
+CLUSTERING_FIELDS = ("answers", "short_circuited", "clusters", "propagated")
+
+
+def active_run(exam):
+    """
+    The exam's queued or running run, if it is still alive. Dead ones are marked interrupted.
+    """
+    run = GradingRun.objects.filter(exam=exam, status__in=["queued", "running"]).order_by("-id").first()
+    if run is None:
+        return None
+    if run.status == "running" and run.updated_at < timezone.now() - timedelta(seconds=STALE_SECONDS):
+        GradingRun.objects.filter(id=run.id).update(status="interrupted", finished_at=timezone.now())
+        return None
+    return run
+
+
+def start_grading_run(exam, mode="batched"):
+    """
+    Queue a run for the exam as a "grade_exam" job. Returns (run, created);
+    when a run (of either mode) is already active it is returned instead.
+    """
+    with transaction.atomic():
+        run = active_run(exam)
+        if run is not None:
+            return run, False
+        run = GradingRun.objects.create(exam=exam, mode=mode)
+        enqueue("grade_exam", {"run_id": run.id}, idempotency_key=f"grade_exam:{run.id}",
+                priority="bulk", tenant=scheduler.tenant_key(exam.course))
+    return run, True
+
+
+def execute_grading_run(run, max_workers=None, on_progress=None, heartbeat=None):
+    """
+    Grade every ungraded answer of the run's exam and save each result as it arrives.
+    `on_progress(run)` is called after every saved batch, `heartbeat()` every
+    HEARTBEAT_SECONDS while the run is alive, however slow its batches are.
+    """
+    from .views import load_current_grader
+
+    exam = run.exam
+    started = time.perf_counter()
+    usage = empty_usage()
+    for field in USAGE_FIELDS:
+        usage[field] = (run.token_usage or {}).get(field, 0)
+    usage_lock = Lock()
+    clustered = run.mode == "clustered"
+    clustering = {key: (run.clustering or {}).get(key, 0) for key in CLUSTERING_FIELDS}
+
+    try:
+        grader_executor = load_current_grader(exam, exam.course_id)
+        answers = list(
+            StudentAnswer.objects
+            .filter(submission__exam=exam, is_graded=False)
+            .select_related("question")
+            .order_by("question_id", "id")
+        )
+        # A run picked up again after its worker died keeps what it already graded
+        run.status = "running"
+        run.total_answers = run.graded_answers + len(answers)
+        run.failed_answers = 0
+        run.save(update_fields=["status", "total_answers", "failed_answers", "updated_at"])
+
+        # One task per batch of answers to the same question
+        tasks = []
+        by_question = {}
+        for answer in answers:
+            by_question.setdefault(answer.question_id, []).append(answer)
+        for question_answers in by_question.values():
+            grader = grader_executor.graders.get(question_answers[0].question.question)
+            if clustered:
+                # Near-duplicates are looked for among all of a question's answers
+                tasks.append((grader, question_answers))
+                continue
+            size = grader.batch_limit() if grader is not None else len(question_answers)
+            for i in range(0, len(question_answers), size):
+                tasks.append((grader, question_answers[i:i + size]))
+
+        def grade(grader, batch):
+            if grader is None:
+                return [None] * len(batch)
+            batch_usage = empty_usage()
+            try:
+                if clustered:
+                    results, report = grader_executor.grade_question_clustered(
+                        grader.question, [a.answer_text for a in batch], usage=batch_usage
+                    )
+                    with usage_lock:
+                        for key in CLUSTERING_FIELDS:
+                            clustering[key] += report[key]
+                else:
+                    results = grader.grade_batch([a.answer_text for a in batch], usage=batch_usage)
+            except Exception as e:
+                print(f"Grading run {run.id}: batch failed: {e}")
+                results = [None] * len(batch)
+            with usage_lock:
+                for field in USAGE_FIELDS:
+                    usage[field] += batch_usage[field]
+            return results
+
+        submissions = set()
+        if tasks:
+            executor = ThreadPoolExecutor(max_workers=min(max_workers or MAX_WORKERS, len(tasks)))
+            try:
+                with scheduler.priority("bulk", scheduler.tenant_key(exam.course)):
+                    futures = {scheduler.submit(executor, grade, grader, batch): batch for grader, batch in tasks}
+                pending = set(futures)
+                last_beat = time.monotonic()
+                while pending:
+                    done, pending = wait(pending, timeout=HEARTBEAT_SECONDS, return_when=FIRST_COMPLETED)
+                    if time.monotonic() - last_beat >= HEARTBEAT_SECONDS:
+                        last_beat = time.monotonic()
+                        GradingRun.objects.filter(id=run.id).update(updated_at=timezone.now())
+                        if heartbeat is not None:
+                            heartbeat()
+                    for future in done:
+                        batch = futures[future]
+                        graded, failed = save_results(batch, future.result())
+                        submissions.update(a.submission_id for a in batch)
+                        with usage_lock:
+                            run.token_usage = dict(usage)
+                            run.clustering = dict(clustering) if clustered else {}
+                        GradingRun.objects.filter(id=run.id).update(
+                            graded_answers=F("graded_answers") + graded,
+                            failed_answers=F("failed_answers") + failed,
+                            token_usage=run.token_usage,
+                            clustering=run.clustering,
+                            wall_seconds=time.perf_counter() - started,
+                            updated_at=timezone.now(),
+                        )
+                        if on_progress is not None:
+                            run.refresh_from_db()
+                            on_progress(run)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        update_submission_scores(submissions)
+        run.status = "completed"
+    except BaseException as e:
+        # KeyboardInterrupt from the management command, or a real failure
+        run.status = "interrupted" if isinstance(e, KeyboardInterrupt) else "failed"
+        run.error = str(e) or e.__class__.__name__
+        raise
+    finally:
+        run.refresh_from_db(fields=["graded_answers", "failed_answers"])
+        run.token_usage = dict(usage)
+        run.clustering = dict(clustering) if clustered else {}
+        run.wall_seconds = time.perf_counter() - started
+        run.finished_at = timezone.now()
+        run.save(update_fields=["status", "error", "token_usage", "clustering", "wall_seconds", "finished_at", "updated_at"])
+    return run
+
+
+def save_results(batch, results):
+    graded = failed = 0
+    for answer, result in zip(batch, results):
+        score = received_score(result)
+        if score is None:
+            failed += 1
+            continue
+        StudentAnswer.objects.filter(id=answer.id).update(
+            received_weight=score,
+            feedback=result.get("overall_feedback") or "",
+            is_graded=True,
+            needs_review=needs_review(result),
+        )
+        graded += 1
+    return graded, failed
+
+
+def needs_review(result):
+    # Scores that did not come from an LLM grading this very answer
+    return bool(result.get("short_circuit") or result.get("provisional") or result.get("needs_review"))
+
+
+def received_score(result):
+    if not isinstance(result, dict):
+        return None
+    try:
+        return float(result["total_score"]["result"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def update_submission_scores(submission_ids):
+    # Only submissions with every answer graded get a total
+    for submission_id in submission_ids:
+        answers = StudentAnswer.objects.filter(submission_id=submission_id)
+        if answers.filter(is_graded=False).exists():
+            continue
+        total = answers.aggregate(total=Sum("received_weight"))["total"] or 0.0
+        StudentExamSubmission.objects.filter(id=submission_id).update(overall_received_score=total)
+
+
+def run_report(run):
+    usage = summarize_usage([run.token_usage])
+    processed = run.graded_answers + run.failed_answers
+    return {
+        "run_id": run.id,
+        "exam_id": run.exam_id,
+        "mode": run.mode,
+        "status": run.status,
+        "total_answers": run.total_answers,
+        "graded_answers": run.graded_answers,
+        "failed_answers": run.failed_answers,
+        "remaining_answers": max(0, run.total_answers - processed),
+        "wall_seconds": round(run.wall_seconds, 3),
+        "answers_per_second": round(processed / run.wall_seconds, 3) if run.wall_seconds else 0.0,
+        "token_usage": usage,
+        "estimated_cost_usd": estimate_cost(usage),
+        "clustering": clustering_report(run.clustering) if run.mode == "clustered" else None,
+        "error": run.error,
+        "created_at": run.created_at,
+        "finished_at": run.finished_at,
+    }
+
+
+def clustering_report(totals):
+    # LLM-graded answers without clustering vs. with it (representatives only)
+    totals = {key: (totals or {}).get(key, 0) for key in CLUSTERING_FIELDS}
+    calls_without = totals["answers"] - totals["short_circuited"]
+    return {
+        **totals,
+        "llm_graded_without_clustering": calls_without,
+        "llm_graded_with_clustering": totals["clusters"],
+        "llm_call_reduction": round(totals["propagated"] / calls_without, 4) if calls_without else 0.0,
+    }
@@ -0,0 +1,292 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Event, Lock, Thread
+import os
+import socket
+import uuid
+
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import Job
+
+
+# Database-backed job queue. Jobs are rows in the Job table; any number of
+# workers (manage.py run_workers, on any node sharing the database) claim them
+# with SELECT ... FOR UPDATE SKIP LOCKED where the database supports it. The
+# claim itself is a compare-and-set UPDATE, so databases without row locks
+# (SQLite in tests) never hand one job to two workers either.
+#
+# A claimed job is locked for VISIBILITY_TIMEOUT seconds; handlers that run
+# longer call touch(). If a worker dies, the lock expires and another worker
+# picks the job up again. Failed jobs are retried with exponential backoff
+# until max_attempts.
+#
+# Due jobs are claimed by priority (interactive, bulk, background) and, within
+# a priority, preferring tenants with the fewest jobs already running. A job
+# that has been due for STARVATION_SECONDS is claimed ahead of its priority.
+
+VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', '600'))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', '10'))
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+STARVATION_SECONDS = float(os.getenv('JOB_STARVATION_SECONDS', '300'))
+# Due jobs considered per claimed job when choosing by priority and tenant
+CLAIM_WINDOW = int(os.getenv('JOB_CLAIM_WINDOW', '20'))
+# Longest wait between polls after claims keep failing
+MAX_POLL_BACKOFF = float(os.getenv('JOB_MAX_POLL_BACKOFF', '60'))
+PRIORITY_RANK = {"interactive": 0, "bulk": 1, "background": 2}
+# Jobs are run by manage.py run_workers. For development without it, web
+# processes can work the queue themselves on this many threads (0 = off).
+IN_PROCESS_WORKER_THREADS = int(os.getenv('JOB_IN_PROCESS_WORKER_THREADS', '0'))
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, payload=None, idempotency_key=None, max_attempts=None, delay=0, priority="bulk", tenant=""):
+    """
+    Add a job. With an idempotency key, enqueuing the same work again returns the first job.
+    """
+    if priority not in PRIORITY_RANK:
+        raise ValueError(f"Unknown job priority: {priority}")
+    fields = {
+        "kind": kind,
+        "payload": payload or {},
+        "priority": priority,
+        "tenant": tenant,
+        "max_attempts": max_attempts or MAX_ATTEMPTS,
+        "run_after": timezone.now() + timedelta(seconds=delay),
+    }
+    if idempotency_key is None:
+        job = Job.objects.create(**fields)
+    else:
+        try:
+            with transaction.atomic():
+                job = Job.objects.create(idempotency_key=idempotency_key, **fields)
+        except IntegrityError:
+            return Job.objects.get(idempotency_key=idempotency_key)
+    transaction.on_commit(ensure_in_process_worker)
+    return job
+
+
+def claimable(now):
+    expired = Q(status="running", locked_until__lt=now, attempts__lt=F("max_attempts"))
+    return Q(status="queued", run_after__lte=now) | expired
+
+
+def claim(worker_id, limit=1, kinds=None):
+    """
+    Lock up to `limit` due jobs for this worker and return them.
+    """
+    now = timezone.now()
+    # Jobs whose worker died on their last attempt
+    Job.objects.filter(status="running", locked_until__lt=now, attempts__gte=F("max_attempts")).update(
+        status="failed", last_error="Visibility timeout expired", locked_until=None, finished_at=now, updated_at=now,
+    )
+    with transaction.atomic():
+        candidates = Job.objects.filter(claimable(now)).annotate(rank=claim_rank(now)).order_by("rank", "run_after", "id")
+        if kinds:
+            candidates = candidates.filter(kind__in=kinds)
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        rows = list(candidates.values_list("id", "attempts", "rank", "tenant", "run_after")[:limit * CLAIM_WINDOW])
+        rows = choose(rows, limit, now)
+
+        claimed = []
+        for job_id, attempts in rows:
+            updated = Job.objects.filter(claimable(now), id=job_id, attempts=attempts).update(
+                status="running",
+                attempts=F("attempts") + 1,
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=VISIBILITY_TIMEOUT),
+                updated_at=now,
+            )
+            if updated:
+                claimed.append(job_id)
+    return list(Job.objects.filter(id__in=claimed).order_by("id"))
+
+
+def claim_rank(now):
+    # Starved jobs first, then by priority
+    starved_before = now - timedelta(seconds=STARVATION_SECONDS)
+    return Case(
+        When(run_after__lte=starved_before, then=Value(-1)),
+        *[When(priority=name, then=Value(rank)) for name, rank in PRIORITY_RANK.items()],
+        default=Value(len(PRIORITY_RANK)),
+        output_field=IntegerField(),
+    )
+
+
+def choose(rows, limit, now):
+    """
+    Pick `limit` of the due (id, attempts, rank, tenant, run_after) rows, best rank
+    first and, within a rank, the tenants with the fewest jobs running.
+    """
+    running = dict(
+        Job.objects.filter(status="running", locked_until__gte=now)
+        .values_list("tenant").annotate(count=Count("id")).order_by()
+    )
+    remaining = list(rows)
+    chosen = []
+    while remaining and len(chosen) < limit:
+        best = min(remaining, key=lambda row: (row[2], running.get(row[3], 0), row[4], row[0]))
+        remaining.remove(best)
+        running[best[3]] = running.get(best[3], 0) + 1
+        chosen.append((best[0], best[1]))
+    return chosen
+
+
+def touch(job):
+    """
+    Extend the lock of a long-running job. Returns False if the job is no longer ours.
+    """
+    now = timezone.now()
+    return bool(Job.objects.filter(id=job.id, status="running", locked_by=job.locked_by).update(
+        locked_until=now + timedelta(seconds=VISIBILITY_TIMEOUT), updated_at=now,
+    ))
+
+
+def complete(job, result=None):
+    now = timezone.now()
+    Job.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status="succeeded", result=result, locked_until=None, finished_at=now, updated_at=now,
+    )
+
+
+def fail(job, error):
+    now = timezone.now()
+    owned = Job.objects.filter(id=job.id, locked_by=job.locked_by)
+    if job.attempts < job.max_attempts:
+        delay = RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        owned.update(status="queued", last_error=error, locked_by=None, locked_until=None,
+                     run_after=now + timedelta(seconds=delay), updated_at=now)
+    else:
+        owned.update(status="failed", last_error=error, locked_until=None, finished_at=now, updated_at=now)
+
+
+def execute(job):
+    fn = HANDLERS.get(job.kind)
+    try:
+        if fn is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        complete(job, fn(job))
+    except Exception as e:
+        print(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {e}")
+        fail(job, f"{e.__class__.__name__}: {e}")
+    finally:
+        connection.close()
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def work(threads=1, worker_id=None, kinds=None, stop=None, drain=False, poll_interval=None):
+    """
+    Claim and run jobs on `threads` threads until `stop` is set
+    (or, with drain=True, until no job is due).
+    """
+    worker_id = worker_id or default_worker_id()
+    poll_interval = POLL_INTERVAL if poll_interval is None else poll_interval
+    stop = stop or Event()
+    running = set()
+    running_lock = Lock()
+
+    def finished(future):
+        with running_lock:
+            running.discard(future)
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job-worker") as executor:
+        while not stop.is_set():
+            with running_lock:
+                free = threads - len(running)
+            try:
+                jobs = claim(worker_id, limit=free, kinds=kinds) if free > 0 else []
+                failures = 0
+            except Exception as e:
+                # e.g. the database restarted; drop the broken connection and poll again later
+                failures += 1
+                print(f"Job worker {worker_id}: claim failed ({failures} in a row): {e}")
+                close_old_connections()
+                connection.close()
+                stop.wait(min(poll_interval * 2 ** failures, MAX_POLL_BACKOFF))
+                continue
+            for job in jobs:
+                future = executor.submit(execute, job)
+                with running_lock:
+                    running.add(future)
+                future.add_done_callback(finished)
+            if jobs:
+                continue
+            with running_lock:
+                idle = not running
+            if drain and idle:
+                break
+            stop.wait(poll_interval)
+    connection.close()
+
+
+_in_process_worker = None
+_in_process_worker_lock = Lock()
+
+
+def ensure_in_process_worker():
+    """
+    Start a worker thread in this process, or a new one if it died, unless
+    disabled with JOB_IN_PROCESS_WORKER_THREADS=0.
+    """
+    global _in_process_worker
+    if IN_PROCESS_WORKER_THREADS <= 0 or (_in_process_worker is not None and _in_process_worker.is_alive()):
+        return
+    with _in_process_worker_lock:
+        if _in_process_worker is None or not _in_process_worker.is_alive():
+            if _in_process_worker is not None:
+                print("In-process job worker died; starting a new one")
+            _in_process_worker = Thread(
+                target=work, kwargs={"threads": IN_PROCESS_WORKER_THREADS}, name="job-worker-main", daemon=True,
+            )
+            _in_process_worker.start()
+
+
+# -------------------------------------------------------------------
+# Handlers
+# -------------------------------------------------------------------
+@handler("grade_exam")
+def grade_exam_job(job):
+    from .grading_runs import execute_grading_run, run_report
+    from .models import GradingRun
+
+    run = GradingRun.objects.select_related("exam__course").get(id=job.payload["run_id"])
+    if run.status in ("completed", "failed"):
+        return run_report(run)
+    execute_grading_run(run, on_progress=lambda _: touch(job), heartbeat=lambda: touch(job))
+    return run_report(run)
+
+
+@handler("build_grader")
+def build_grader_job(job):
+    from .models import Exam
+    from .views import create_and_save_grader
+
+    try:
+        exam = Exam.objects.get(id=job.payload["exam_id"])
+    except Exam.DoesNotExist:
+        return {"skipped": "exam deleted"}
+    grader_spec = create_and_save_grader(exam, exam.course_id)
+    return {"version": grader_spec.version if grader_spec is not None else None}
+
+
+@handler("ingest_note")
+def ingest_note_job(job):
+    from .views import ingest_note_chunks
+
+    return {"chunks": ingest_note_chunks(job.payload["note_id"], job.payload["chunks"])}
@@ -0,0 +1,83 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from apps.accounts import authentication
+from apps.accounts.grader_utils.metrics import quantile
+from apps.accounts.models import Professor, Student, UserToken
+
+
+def legacy_lookup(token_value):
+    # What every view did before CachedTokenAuthentication: token, then its user
+    token_obj = UserToken.objects.get(token=token_value)
+    model = Professor if token_obj.user_type == "professor" else Student
+    return model.objects.get(id=token_obj.user_id)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of authenticating a request: the per-view token and user "
+        "lookups this app used to do, CachedTokenAuthentication without and with "
+        "its cache, and a whole authenticated request with the cache off and on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--token", help="Token to authenticate with (default: the newest professor token)")
+        parser.add_argument("--path", default="/api/get-courses/", help="Endpoint for the end-to-end comparison")
+
+    def handle(self, *args, **options):
+        token = options["token"] or (
+            UserToken.objects.filter(user_type="professor").order_by("-id").values_list("token", flat=True).first()
+        )
+        if token is None:
+            self.stdout.write("No professor token to benchmark; log in once or pass --token.")
+            return
+        n = options["requests"]
+        cache = authentication.cache
+        ttl = cache.ttl
+
+        def uncached(token_value):
+            cache.clear()
+            return authentication.resolve(token_value)
+
+        try:
+            rows = [
+                ("per-view lookups (before)", self.time_calls(lambda: legacy_lookup(token), n)),
+                ("authentication, cache off", self.time_calls(lambda: uncached(token), n)),
+                ("authentication, cache on", self.time_calls(lambda: authentication.resolve(token), n)),
+            ]
+            client = Client(HTTP_AUTHORIZATION=f"Token {token}")
+            cache.ttl = 0
+            cache.clear()
+            rows.append((f"GET {options['path']}, cache off", self.time_calls(lambda: client.get(options["path"]), n)))
+            cache.ttl = ttl
+            rows.append((f"GET {options['path']}, cache on", self.time_calls(lambda: client.get(options["path"]), n)))
+        finally:
+            cache.ttl = ttl
+            cache.clear()
+
+        self.stdout.write(f"shared cache: {settings.CACHES['default']['BACKEND']}")
+        self.stdout.write(f"{'':40} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8}")
+        for name, (samples, queries) in rows:
+            self.stdout.write(
+                f"{name:40} {quantile(samples, 0.5) * 1000:8.3f} {quantile(samples, 0.95) * 1000:8.3f} {queries:8.1f}"
+            )
+
+    @staticmethod
+    def time_calls(call, n):
+        """
+        (per-call seconds, mean queries per call) over n calls, after one warm-up call.
+        """
+        call()
+        samples = []
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(n):
+                started = time.perf_counter()
+                call()
+                samples.append(time.perf_counter() - started)
+        return samples, len(captured) / n
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts.grader_utils.context import build_context, CANDIDATES
+from apps.accounts.grader_utils.grader import Grader, estimate_tokens
+from apps.accounts.models import AssessmentQuestion
+from apps.accounts.views import retrieve_candidate_chunks
+
+SHINGLE_WORDS = 5
+
+
+def shingles(texts):
+    result = set()
+    for text in texts:
+        words = text.lower().split()
+        for i in range(max(1, len(words) - SHINGLE_WORDS + 1)):
+            result.add(" ".join(words[i:i + SHINGLE_WORDS]))
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the raw top-k retrieved chunks with the token-budgeted context "
+        "(merged overlaps, MMR de-duplication) for every question: prompt tokens, "
+        "build time, and recall of the raw top-k text."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, help="Only questions of this course")
+        parser.add_argument("--top-k", type=int, default=3)
+        parser.add_argument("--budget", type=int, default=None, help="Context token budget")
+
+    def handle(self, *args, **options):
+        questions = AssessmentQuestion.objects.select_related("exam", "exam__course")
+        if options["course"]:
+            questions = questions.filter(exam__course_id=options["course"])
+
+        rows = []
+        for q in questions:
+            course_id = q.exam.course_id
+            q_emb, candidates = retrieve_candidate_chunks(q.question, course_id, max(options["top_k"], CANDIDATES))
+            if not candidates:
+                continue
+            baseline = [text for _, text, _ in candidates[:options["top_k"]]]
+
+            started = time.perf_counter()
+            built = build_context(q_emb, candidates, top_k=options["top_k"], token_budget=options["budget"])
+            build_seconds = time.perf_counter() - started
+
+            baseline_shingles = shingles(baseline)
+            recall = len(baseline_shingles & shingles(built)) / len(baseline_shingles) if baseline_shingles else 1.0
+            prompt_before = estimate_tokens(Grader(q.exam.rubrics, baseline, q.question, q.min_words, q.question_weight).system_prompt())
+            prompt_after = estimate_tokens(Grader(q.exam.rubrics, built, q.question, q.min_words, q.question_weight).system_prompt())
+            rows.append((q.id, prompt_before, prompt_after, recall, build_seconds))
+            self.stdout.write(
+                f"question {q.id}: prompt tokens {prompt_before} -> {prompt_after}, "
+                f"recall {recall:.2%}, build {build_seconds * 1000:.1f}ms"
+            )
+
+        if not rows:
+            self.stdout.write("No questions with course notes to benchmark.")
+            return
+
+        before = sum(row[1] for row in rows)
+        after = sum(row[2] for row in rows)
+        self.stdout.write("")
+        self.stdout.write(f"questions:          {len(rows)}")
+        self.stdout.write(f"prompt tokens:      {before} -> {after} ({(before - after) / before:.1%} fewer)")
+        self.stdout.write(f"mean recall:        {sum(row[3] for row in rows) / len(rows):.2%}")
+        self.stdout.write(f"mean build time:    {sum(row[4] for row in rows) / len(rows) * 1000:.1f}ms")
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+import json
+import pickle
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts.grader_utils.execute_grader import ExecuteGrader
+from apps.accounts.models import GraderSpec
+
+WORDS = ("grading rubric answer context student model retrieval cache token "
+         "question exam course lecture concept example definition").split()
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the size and load time of an exam grader stored as a pickle "
+        "with the JSON grader spec it is stored as now."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exam", type=int, help="Use this exam's stored grader spec")
+        parser.add_argument("--legacy-file", help="Use a graders/exam_<id>_graders.pkl file as saved by older versions")
+        parser.add_argument("--questions", type=int, default=5, help="Questions of the synthetic exam")
+        parser.add_argument("--context-words", type=int, default=1200, help="Context words per synthetic question")
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        pickled = None
+        if options["legacy_file"]:
+            with open(options["legacy_file"], "rb") as file_handler:
+                pickled = file_handler.read()
+            executor = pickle.loads(pickled)
+        elif options["exam"]:
+            executor = ExecuteGrader.from_spec(GraderSpec.objects.get(exam_id=options["exam"]).spec)
+        else:
+            rng = random.Random(0)
+            questions = [
+                SimpleNamespace(id=i + 1, exam_id=0, question=f"Question {i + 1}: explain concept {i + 1}.",
+                                min_words=50, question_weight=10, reference_answer=None)
+                for i in range(options["questions"])
+            ]
+            context = {
+                q.question: [" ".join(rng.choice(WORDS) for _ in range(options["context_words"]))]
+                for q in questions
+            }
+            executor = ExecuteGrader(rubrics="Accuracy 50%, clarity 30%, examples 20%.",
+                                     retrived_chunks=context, assessments=questions)
+
+        iterations = options["iterations"]
+        pickled = pickled or pickle.dumps(executor)
+        spec_json = json.dumps(executor.to_spec())
+
+        pickle_seconds = timed(lambda: pickle.loads(pickled), iterations)
+        spec_seconds = timed(lambda: ExecuteGrader.from_spec(json.loads(spec_json)), iterations)
+
+        self.stdout.write(f"questions:          {len(executor.graders)}")
+        self.stdout.write(f"pickle:             {len(pickled)} bytes, load {pickle_seconds * 1000:.3f}ms")
+        self.stdout.write(f"spec (JSON):        {len(spec_json)} bytes, load {spec_seconds * 1000:.3f}ms")
+        self.stdout.write(f"size ratio:         {len(spec_json) / len(pickled):.2f}x")
+
+        if options["exam"]:
+            exam_id = options["exam"]
+            db_seconds = timed(
+                lambda: ExecuteGrader.from_spec(GraderSpec.objects.values_list("spec", flat=True).get(exam_id=exam_id)),
+                iterations,
+            )
+            self.stdout.write(f"spec from database: load {db_seconds * 1000:.3f}ms")
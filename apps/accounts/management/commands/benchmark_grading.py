@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from threading import Lock
+import math
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts.grader_utils import hedging, routing
+from apps.accounts.grader_utils.backends import FakeBackend, RecordReplayBackend, get_backend, set_backend
+from apps.accounts.grader_utils.execute_grader import ExecuteGrader
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class TimedBackend:
+    """
+    Wraps a backend and records the wall time of every call.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.latencies = []
+        self.route_latencies = {}
+        self._lock = Lock()
+
+    def run(self, grader, prompt, route=routing.LARGE):
+        started = time.perf_counter()
+        try:
+            return self.inner.run(grader, prompt, route)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - started)
+                self.route_latencies.setdefault(route, []).append(self.latencies[-1])
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ExecuteGrader throughput, retries and concurrency offline, "
+        "using the fake model or recorded responses instead of the Anthropic API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", choices=["fake", "replay"], default="fake")
+        parser.add_argument("--replay-dir", help="Directory of recorded responses (replay backend)")
+        parser.add_argument("--students", type=int, default=50, help="Submissions to grade")
+        parser.add_argument("--questions", type=int, default=5, help="Questions per exam")
+        parser.add_argument("--workers", type=int, default=10, help="Concurrent LLM calls per submission")
+        parser.add_argument("--parallel-exams", type=int, default=1, help="Submissions graded at the same time")
+        parser.add_argument("--latency-ms", type=float, default=800.0, help="Median fake model latency")
+        parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of fake latency")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake responses that are not JSON")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--hedge", action="store_true", help="Send a duplicate request after the p95 latency")
+        parser.add_argument("--compare-hedging", action="store_true", help="Run twice, with hedging off and on")
+        parser.add_argument("--hedge-min-delay", type=float, default=None, help="Seconds before hedging while p95 is unknown")
+        parser.add_argument("--question-deadline", type=float, default=None, help="Seconds per question (0 = none)")
+        parser.add_argument("--exam-deadline", type=float, default=None, help="Seconds per submission (0 = none)")
+
+    def handle(self, *args, **options):
+        runs = [False, True] if options["compare_hedging"] else [options["hedge"]]
+        previous_backend = get_backend()
+        previous_policy = hedging.get_policy()
+        try:
+            for hedge in runs:
+                backend = TimedBackend(self.create_backend(options))
+                set_backend(backend)
+                hedging.set_policy(hedging.HedgePolicy(enabled=hedge, min_delay=options["hedge_min_delay"]))
+                self.run_benchmark(backend, options, hedge)
+        finally:
+            set_backend(previous_backend)
+            hedging.set_policy(previous_policy)
+
+    def create_backend(self, options):
+        if options["backend"] == "fake":
+            return FakeBackend(
+                latency_ms=options["latency_ms"],
+                latency_sigma=options["latency_sigma"],
+                error_rate=options["error_rate"],
+                seed=options["seed"],
+            )
+        replay_options = {"directory": options["replay_dir"]} if options["replay_dir"] else {}
+        return RecordReplayBackend("replay", **replay_options)
+
+    def run_benchmark(self, backend, options, hedge):
+        rng = random.Random(options["seed"])
+        questions = [
+            SimpleNamespace(question=f"Benchmark question {i + 1}?", min_words=50, question_weight=10)
+            for i in range(options["questions"])
+        ]
+        grader_executor = ExecuteGrader(
+            rubrics="Accuracy, completeness and clarity.",
+            retrived_chunks={q.question: ["Benchmark context."] for q in questions},
+            assessments=questions,
+        )
+
+        submissions = [
+            [
+                {
+                    "question_id": i,
+                    "question_text": q.question,
+                    "answer_text": " ".join(["word"] * rng.randint(20, 400)),
+                }
+                for i, q in enumerate(questions)
+            ]
+            for _ in range(options["students"])
+        ]
+
+        exam_latencies = []
+        latency_lock = Lock()
+
+        def grade(answerdata):
+            started = time.perf_counter()
+            grader_executor.grade_exams(
+                answerdata,
+                max_workers=options["workers"],
+                question_deadline=options["question_deadline"],
+                exam_deadline=options["exam_deadline"],
+            )
+            with latency_lock:
+                exam_latencies.append(time.perf_counter() - started)
+            return answerdata
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, options["parallel_exams"])) as executor:
+            results = list(executor.map(grade, submissions))
+        wall_time = time.perf_counter() - started
+
+        answers = [asmt for answerdata in results for asmt in answerdata]
+        pending = sum(1 for asmt in answers if asmt.get("status") == "pending")
+        failed = sum(1 for asmt in answers if asmt.get("feedback") is None) - pending
+        usage = ExecuteGrader.usage_report(answers)
+        llm_answers = len(answers) - usage["short_circuited_answers"] - pending
+        calls = len(backend.latencies)
+
+        self.stdout.write(f"backend:            {backend.name} (hedging {'on' if hedge else 'off'})")
+        self.stdout.write(f"submissions:        {len(results)} x {len(questions)} questions")
+        self.stdout.write(f"wall time:          {wall_time:.2f}s")
+        self.stdout.write(f"throughput:         {len(answers) / wall_time:.2f} answers/s" if wall_time else "throughput: n/a")
+        self.stdout.write(f"llm calls:          {calls} ({max(0, calls - llm_answers)} retries and hedges)")
+        self.stdout.write(f"failed answers:     {failed}")
+        self.stdout.write(f"pending answers:    {pending}")
+        self.stdout.write(f"input tokens:       {usage['uncached_input_tokens']} uncached, {usage['cached_input_tokens']} cached")
+        self.stdout.write(f"output tokens:      {usage['output_tokens']}")
+        timings = [("call latency", backend.latencies)]
+        if routing.ENABLED:
+            timings += [(f"{route} model calls", values) for route, values in sorted(backend.route_latencies.items())]
+        timings.append(("exam latency", exam_latencies))
+        for label, values in timings:
+            self.stdout.write(
+                f"{label + ':':<20}p50 {percentile(values, 50):.3f}s  "
+                f"p95 {percentile(values, 95):.3f}s  p99 {percentile(values, 99):.3f}s"
+            )
+        self.stdout.write("")
@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+from types import SimpleNamespace
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts.grader_utils import scheduler
+from apps.accounts.grader_utils.backends import FakeBackend, get_backend, set_backend
+from apps.accounts.grader_utils.execute_grader import ExecuteGrader
+from apps.accounts.management.commands.benchmark_grading import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark interactive grading latency while bulk grading runs saturate the LLM slots, "
+        "with the fair priority scheduler and with first-come-first-served for comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slots", type=int, default=8, help="Concurrent LLM requests (GRADER_LLM_SLOTS)")
+        parser.add_argument("--bulk-tenants", type=int, default=2, help="Professors running bulk grading at once")
+        parser.add_argument("--bulk-answers", type=int, default=400, help="Answers per bulk run")
+        parser.add_argument("--bulk-workers", type=int, default=10, help="Concurrent batches per bulk run")
+        parser.add_argument("--interactive", type=int, default=30, help="Interactive submissions to grade")
+        parser.add_argument("--interval", type=float, default=0.5, help="Seconds between interactive submissions")
+        parser.add_argument("--questions", type=int, default=3, help="Questions per submission")
+        parser.add_argument("--latency-ms", type=float, default=300.0, help="Median fake model latency")
+        parser.add_argument("--latency-sigma", type=float, default=0.3, help="Log-normal spread of fake latency")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--policy", choices=["fair", "fifo", "both"], default="both")
+
+    def handle(self, *args, **options):
+        policies = ["fifo", "fair"] if options["policy"] == "both" else [options["policy"]]
+        previous_backend = get_backend()
+        previous_scheduler = scheduler.get_scheduler()
+        try:
+            for policy in policies:
+                set_backend(FakeBackend(
+                    latency_ms=options["latency_ms"],
+                    latency_sigma=options["latency_sigma"],
+                    error_rate=0,
+                    seed=options["seed"],
+                ))
+                scheduler.set_scheduler(scheduler.SlotScheduler(slots=options["slots"], policy=policy))
+                self.run_benchmark(policy, options)
+        finally:
+            set_backend(previous_backend)
+            scheduler.set_scheduler(previous_scheduler)
+
+    def run_benchmark(self, policy, options):
+        rng = random.Random(options["seed"])
+        questions = [
+            SimpleNamespace(question=f"Benchmark question {i + 1}?", min_words=5, question_weight=10)
+            for i in range(options["questions"])
+        ]
+        grader_executor = ExecuteGrader(
+            rubrics="Accuracy, completeness and clarity.",
+            retrived_chunks={q.question: ["Benchmark context."] for q in questions},
+            assessments=questions,
+        )
+
+        def answer_text():
+            return " ".join(["word"] * rng.randint(20, 200))
+
+        stop = Event()
+        bulk_done = {"answers": 0}
+        bulk_lock = Lock()
+
+        def bulk_run(tenant):
+            grader = grader_executor.graders[questions[0].question]
+            size = grader.batch_limit()
+            batches = [[answer_text() for _ in range(size)] for _ in range(options["bulk_answers"] // size)]
+
+            def grade(batch):
+                if stop.is_set():
+                    return
+                grader.grade_batch(batch)
+                with bulk_lock:
+                    bulk_done["answers"] += len(batch)
+
+            with scheduler.priority("bulk", tenant):
+                with ThreadPoolExecutor(max_workers=options["bulk_workers"]) as executor:
+                    for batch in batches:
+                        scheduler.submit(executor, grade, batch)
+
+        latencies = []
+
+        def interactive(index):
+            answerdata = [
+                {"question_id": i, "question_text": q.question, "answer_text": answer_text()}
+                for i, q in enumerate(questions)
+            ]
+            started = time.perf_counter()
+            with scheduler.priority("interactive", f"professor:interactive-{index % 5}"):
+                grader_executor.grade_exams(answerdata)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        bulk_pool = ThreadPoolExecutor(max_workers=options["bulk_tenants"])
+        for tenant in range(options["bulk_tenants"]):
+            bulk_pool.submit(bulk_run, f"professor:bulk-{tenant}")
+        # Let the bulk runs fill the queue first
+        time.sleep(options["interval"])
+        with ThreadPoolExecutor(max_workers=options["interactive"]) as interactive_pool:
+            for index in range(options["interactive"]):
+                interactive_pool.submit(interactive, index)
+                time.sleep(options["interval"])
+        interactive_seconds = time.perf_counter() - started
+        stop.set()
+        bulk_pool.shutdown(wait=True)
+
+        stats = scheduler.get_scheduler().stats()
+        self.stdout.write(f"policy:               {policy} ({stats['slots']} slots)")
+        self.stdout.write(f"bulk answers graded:  {bulk_done['answers']} in {interactive_seconds:.2f}s "
+                          f"while interactive traffic ran")
+        self.stdout.write(
+            f"interactive latency:  p50 {percentile(latencies, 50):.3f}s  "
+            f"p95 {percentile(latencies, 95):.3f}s  p99 {percentile(latencies, 99):.3f}s"
+        )
+        self.stdout.write("")
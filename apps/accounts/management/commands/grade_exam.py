@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.grading_runs import active_run, execute_grading_run, run_report
+from apps.accounts.models import Exam, GradingRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Grade every ungraded answer of an exam in the foreground, saving each result "
+        "as it arrives. Run it again after an interruption to grade what is left."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("exam_id", type=int)
+        parser.add_argument("--workers", type=int, default=None, help="Concurrent LLM requests (default GRADER_MAX_WORKERS)")
+        parser.add_argument("--clustered", action="store_true",
+                            help="Grade one representative of each group of near-identical answers")
+
+    def handle(self, *args, **options):
+        try:
+            exam = Exam.objects.get(id=options["exam_id"])
+        except Exam.DoesNotExist:
+            raise CommandError(f"Exam {options['exam_id']} not found")
+
+        running = active_run(exam)
+        if running is not None:
+            raise CommandError(f"Grading run {running.id} is already in progress for this exam")
+
+        run = GradingRun.objects.create(exam=exam, mode="clustered" if options["clustered"] else "batched")
+        self.stdout.write(f"Grading run {run.id} for exam {exam.id} ({exam.exam_name})")
+
+        def progress(run):
+            done = run.graded_answers + run.failed_answers
+            self.stdout.write(f"  {done}/{run.total_answers} answers ({run.failed_answers} failed)")
+
+        try:
+            execute_grading_run(run, max_workers=options["workers"], on_progress=progress)
+        except KeyboardInterrupt:
+            self.stdout.write("Interrupted; graded answers are saved, run the command again to resume.")
+
+        report = run_report(run)
+        self.stdout.write("")
+        self.stdout.write(f"status:             {report['status']}")
+        self.stdout.write(f"answers:            {report['graded_answers']} graded, {report['failed_answers']} failed, "
+                          f"{report['remaining_answers']} remaining")
+        self.stdout.write(f"wall time:          {report['wall_seconds']:.2f}s")
+        self.stdout.write(f"throughput:         {report['answers_per_second']:.2f} answers/s")
+        self.stdout.write(f"tokens:             {report['token_usage']['input_tokens']} in, "
+                          f"{report['token_usage']['output_tokens']} out, "
+                          f"cache hit ratio {report['token_usage']['cache_hit_ratio']:.1%}")
+        self.stdout.write(f"estimated cost:     ${report['estimated_cost_usd']:.4f}")
+        if report["clustering"] is not None:
+            clustering = report["clustering"]
+            self.stdout.write(f"clustering:         {clustering['llm_graded_with_clustering']} of "
+                              f"{clustering['llm_graded_without_clustering']} answers sent to the LLM, "
+                              f"{clustering['propagated']} copied for review")
@@ -0,0 +1,60 @@
+from threading import Event
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.accounts import jobs
+
+
+def worker_process(threads, kinds, drain):
+    import django
+    django.setup()
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    jobs.IN_PROCESS_WORKER_THREADS = 0
+    jobs.work(threads=threads, kinds=kinds, stop=stop, drain=drain)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background job workers (grading runs, grader builds, note ingestion). "
+        "Start it on as many nodes as needed; workers coordinate through the database. "
+        "Without it, queued jobs only run if JOB_IN_PROCESS_WORKER_THREADS is set (development)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=1,
+            help="Each process has its own GRADER_LLM_SLOTS concurrent LLM requests",
+        )
+        parser.add_argument("--threads", type=int, default=4, help="Jobs run at the same time per process")
+        parser.add_argument("--kind", action="append", dest="kinds", help="Only run jobs of this kind (repeatable)")
+        parser.add_argument("--drain", action="store_true", help="Exit once no job is due")
+
+    def handle(self, *args, **options):
+        threads, kinds, drain = options["threads"], options["kinds"], options["drain"]
+        self.stdout.write(f"Starting {options['processes']} worker process(es) x {threads} thread(s)")
+
+        if options["processes"] <= 1:
+            worker_process(threads, kinds, drain)
+            return
+
+        # Children open their own connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=worker_process, args=(threads, kinds, drain), name=f"job-worker-{i}")
+            for i in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
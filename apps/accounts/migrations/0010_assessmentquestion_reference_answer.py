@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_alter_studentexamsubmission_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessmentquestion',
+            name='reference_answer',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
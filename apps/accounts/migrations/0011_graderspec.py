@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_assessmentquestion_reference_answer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraderSpec',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('spec', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('exam', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='grader_spec', to='accounts.exam')),
+            ],
+        ),
+    ]
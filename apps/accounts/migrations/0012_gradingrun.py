@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_graderspec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('interrupted', 'Interrupted')], default='queued', max_length=20)),
+                ('total_answers', models.PositiveIntegerField(default=0)),
+                ('graded_answers', models.PositiveIntegerField(default=0)),
+                ('failed_answers', models.PositiveIntegerField(default=0)),
+                ('token_usage', models.JSONField(blank=True, default=dict)),
+                ('wall_seconds', models.FloatField(default=0.0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grading_runs', to='accounts.exam')),
+            ],
+        ),
+    ]
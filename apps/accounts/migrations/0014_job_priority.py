@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='priority',
+            field=models.CharField(choices=[('interactive', 'Interactive'), ('bulk', 'Bulk'), ('background', 'Background')], default='bulk', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='tenant',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
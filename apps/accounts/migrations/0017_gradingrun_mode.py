@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_studentanswer_needs_review'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gradingrun',
+            name='clustering',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='gradingrun',
+            name='mode',
+            field=models.CharField(choices=[('batched', 'Batched'), ('clustered', 'Clustered')], default='batched', max_length=20),
+        ),
+    ]
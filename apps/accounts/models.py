@@ -3,6 +3,7 @@ from django.contrib.auth.hashers import make_password
 import uuid
 from django.db import models
 from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 
@@ -69,6 +70,8 @@ class AssessmentQuestion(models.Model):
     question = models.TextField()
     question_weight = models.FloatField()
     min_words = models.IntegerField()
+    # Optional model answer used by the pre-grader; never shown to students
+    reference_answer = models.TextField(blank=True, null=True)
     response = models.TextField(blank=True, null=True)
     received_weight = models.FloatField(default=0.0)
     feedback = models.TextField(blank=True, null=True)
@@ -111,6 +114,9 @@ class StudentAnswer(models.Model):
     received_weight = models.FloatField(default=0.0)
     feedback = models.TextField(blank=True, null=True)
     is_graded = models.BooleanField(default=False)
+    # Graded without a final LLM grade (rule short-circuit, reference pre-grader,
+    # copied from a cluster representative); a professor should confirm it
+    needs_review = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Answer by {self.submission.student.full_name} for {self.question.question[:50]}"
@@ -137,3 +143,89 @@ class DocumentChunk(models.Model):
     def __str__(self):
         return f"Chunk {self.id} for note {self.note.note_name}"
 
+
+
+class GraderSpec(models.Model):
+    # Everything needed to rebuild an exam's ExecuteGrader, as JSON (see ExecuteGrader.to_spec)
+    exam = models.OneToOneField(Exam, on_delete=models.CASCADE, related_name="grader_spec")
+    version = models.PositiveIntegerField(default=1)
+    spec = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Grader v{self.version} for {self.exam.exam_name}"
+
+
+class GradingRun(models.Model):
+    # One "grade the whole exam" run; counters are updated as results are saved
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+        ("interrupted", "Interrupted"),
+    ]
+    MODE_CHOICES = [
+        ("batched", "Batched"),
+        # One representative per group of near-identical answers is graded
+        ("clustered", "Clustered"),
+    ]
+
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name="grading_runs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default="batched")
+    total_answers = models.PositiveIntegerField(default=0)
+    graded_answers = models.PositiveIntegerField(default=0)
+    failed_answers = models.PositiveIntegerField(default=0)
+    token_usage = models.JSONField(default=dict, blank=True)
+    wall_seconds = models.FloatField(default=0.0)
+    # Clustered runs: answers, short_circuited, clusters and propagated so far
+    clustering = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Grading run {self.id} for {self.exam.exam_name} ({self.status})"
+
+
+class Job(models.Model):
+    # Durable background work, claimed by run_workers processes (see jobs.py)
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    ]
+    PRIORITY_CHOICES = [
+        ("interactive", "Interactive"),
+        ("bulk", "Bulk"),
+        ("background", "Background"),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default="bulk")
+    # Who the work is for ("professor:<id>" or "course:<id>"), for fair sharing between tenants
+    tenant = models.CharField(max_length=100, blank=True, default="")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Enqueuing twice with the same key returns the existing job
+    idempotency_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True, null=True)
+    # A running job whose lock expired is handed to another worker
+    locked_until = models.DateTimeField(blank=True, null=True)
+    result = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
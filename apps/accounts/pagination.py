@@ -0,0 +1,30 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Cursor pagination for list endpoints that used to return everything: it only
+    applies when the client sends ?cursor= or ?page_size=, so existing clients
+    keep getting the full list.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def is_requested(self, request):
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+    def paginate(self, queryset, request, view=None):
+        """
+        Returns (rows, links): one page and its {"next", "previous"} links when
+        pagination was requested, otherwise every row (in the same order) and None.
+        """
+        if not self.is_requested(request):
+            ordering = (self.ordering,) if isinstance(self.ordering, str) else self.ordering
+            return list(queryset.order_by(*ordering)), None
+        rows = self.paginate_queryset(queryset, request, view)
+        return rows, {"next": self.get_next_link(), "previous": self.get_previous_link()}
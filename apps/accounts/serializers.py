@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import *
 from django.db import transaction
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 from .models import StudentExamSubmission, StudentAnswer
 
@@ -61,11 +63,20 @@ class StudentSubmissionDetailSerializer(serializers.Serializer):
     is_graded = serializers.BooleanField()
     answers = StudentAnswerDetailSerializer(many=True)
 
+def count_subquery(queryset, group_by):
+    # Correlated COUNT(*) over `queryset` (already filtered on OuterRef), 0 when there are no rows
+    counts = queryset.order_by().values(group_by).annotate(count=Count("id")).values("count")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
 class ProfessorExamSummarySerializer(serializers.ModelSerializer):
+    """
+    Expects exams from with_counts(), which computes the counts in the same query.
+    """
     course_name = serializers.CharField(source="course.course_name", read_only=True)
-    num_questions = serializers.SerializerMethodField()
-    num_enrolled_students = serializers.SerializerMethodField()
-    num_students_submitted = serializers.SerializerMethodField()
+    num_questions = serializers.IntegerField(read_only=True)
+    num_enrolled_students = serializers.IntegerField(read_only=True)
+    num_students_submitted = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Exam
@@ -79,18 +90,20 @@ class ProfessorExamSummarySerializer(serializers.ModelSerializer):
             "num_students_submitted",
         ]
 
-    def get_num_questions(self, obj):
-        return obj.assessment_questions.count()
-
-    def get_num_enrolled_students(self, obj):
-        return obj.course.enrollments.count()
-
-    def get_num_students_submitted(self, obj):
-        return obj.submissions.count()
+    @staticmethod
+    def with_counts(exams):
+        return exams.select_related("course").annotate(
+            num_questions=count_subquery(AssessmentQuestion.objects.filter(exam=OuterRef("pk")), "exam"),
+            num_enrolled_students=count_subquery(Enrollment.objects.filter(course=OuterRef("course_id")), "course"),
+            num_students_submitted=count_subquery(StudentExamSubmission.objects.filter(exam=OuterRef("pk")), "exam"),
+        )
 
 
 class StudentExamListSerializer(serializers.ModelSerializer):
-    is_taken = serializers.SerializerMethodField()
+    """
+    Expects exams from with_is_taken(), which resolves is_taken in the same query.
+    """
+    is_taken = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Exam
@@ -102,15 +115,15 @@ class StudentExamListSerializer(serializers.ModelSerializer):
             'is_taken'
         ]
 
-    def get_is_taken(self, obj):
+    @staticmethod
+    def with_is_taken(exams, student):
         """
-        Returns True if the current student has already submitted this exam.
+        is_taken: True if `student` has already submitted the exam.
         """
-        student = self.context.get('student')
-        if not student:
-            return False
-        return StudentExamSubmission.objects.filter(student=student, exam=obj).exists()
-    
+        return exams.annotate(
+            is_taken=Exists(StudentExamSubmission.objects.filter(student=student, exam=OuterRef("pk")))
+        )
+
 class StudentAnswerSerializer(serializers.ModelSerializer):
     question_id = serializers.IntegerField(write_only=True)
 
@@ -158,7 +171,8 @@ class AssessmentQuestionUpdateSerializer(serializers.ModelSerializer):
             'id',
             'question',
             'question_weight',
-            'min_words'
+            'min_words',
+            'reference_answer'
         ]
 
 
@@ -200,6 +214,7 @@ class ExamUpdateSerializer(serializers.ModelSerializer):
                 question.question = q_data.get('question', question.question)
                 question.question_weight = q_data.get('question_weight', question.question_weight)
                 question.min_words = q_data.get('min_words', question.min_words)
+                question.reference_answer = q_data.get('reference_answer', question.reference_answer)
                 question.save()
                 updated_ids.append(q_id)
             else:
@@ -214,10 +229,11 @@ class ExamUpdateSerializer(serializers.ModelSerializer):
         return instance
 
 class AssessmentQuestionReadSerializer(serializers.ModelSerializer):
+    # Includes reference_answer: only for professor-authenticated views
     class Meta:
         model = AssessmentQuestion
         fields = [
-            'id', 'question', 'question_weight', 'min_words',
+            'id', 'question', 'question_weight', 'min_words', 'reference_answer',
             'response', 'received_weight', 'feedback', 'is_graded'
         ]
 
@@ -318,9 +334,27 @@ class ProfessorSerializer(serializers.ModelSerializer):
 
 
 class AssessmentQuestionSerializer(serializers.ModelSerializer):
+    # Served by the open /questions/, /exams/ and /courses/ endpoints, so it
+    # must never include reference_answer
     class Meta:
         model = AssessmentQuestion
-        fields = '__all__'
+        fields = [
+            'id',
+            'exam',
+            'question',
+            'question_weight',
+            'min_words',
+            'response',
+            'received_weight',
+            'feedback',
+            'is_graded'
+        ]
+
+
+class AssessmentQuestionProfessorSerializer(AssessmentQuestionSerializer):
+    # For professor-authenticated views only
+    class Meta(AssessmentQuestionSerializer.Meta):
+        fields = AssessmentQuestionSerializer.Meta.fields + ['reference_answer']
 
 
 class ExamSerializer(serializers.ModelSerializer):
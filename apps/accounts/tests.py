@@ -0,0 +1,153 @@
+from threading import Thread
+from unittest import mock
+import time
+
+from django.test import SimpleTestCase, TestCase
+
+from . import authentication
+from .grader_utils.registry import GraderRegistry
+from .models import (
+    AssessmentQuestion, Course, Enrollment, Exam, Professor, Student, StudentAnswer,
+    StudentExamSubmission, UserToken,
+)
+
+
+class ListQueryCountTests(TestCase):
+    """
+    The list endpoints must cost the same number of queries however many rows
+    they return (no per-exam or per-student queries).
+    """
+
+    def setUp(self):
+        # The shared revocation generation is read on the first request only
+        patcher = mock.patch.object(authentication, "REVOCATION_CHECK_SECONDS", 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        authentication.cache.clear()
+        authentication.cache.checked_at = None
+        self.professor = Professor.objects.create(
+            full_name="Prof", email="prof@example.com", institution_name="Uni", password="x"
+        )
+        self.course = Course.objects.create(professor=self.professor, course_name="Course", course_code="C1")
+        self.student = self.make_student("student")
+        UserToken.objects.create(token="prof-token", user_type="professor", user_id=self.professor.id)
+        UserToken.objects.create(token="student-token", user_type="student", user_id=self.student.id)
+
+    def make_student(self, name):
+        student = Student.objects.create(full_name=name, email=f"{name}@example.com", password="x")
+        Enrollment.objects.create(student=student, course=self.course)
+        return student
+
+    def make_exam(self, name, students, questions=2):
+        exam = Exam.objects.create(course=self.course, exam_name=name, rubrics="Be correct", overall_score=10)
+        exam_questions = [
+            AssessmentQuestion.objects.create(exam=exam, question=f"{name} Q{i}?", question_weight=5, min_words=1)
+            for i in range(questions)
+        ]
+        for student in students:
+            submission = StudentExamSubmission.objects.create(student=student, exam=exam)
+            for question in exam_questions:
+                StudentAnswer.objects.create(submission=submission, question=question, answer_text="an answer")
+        return exam
+
+    def get(self, path, token):
+        return self.client.get(path, HTTP_AUTHORIZATION=f"Token {token}")
+
+    def assertConstantQueries(self, path, token, grow, queries):
+        """
+        `queries` for `path` after one and after five rows made by `grow(i)`.
+        The first request warms the authentication cache.
+        """
+        grow(0)
+        self.get(path, token)
+        with self.assertNumQueries(queries):
+            self.assertEqual(self.get(path, token).status_code, 200)
+        for i in range(1, 5):
+            grow(i)
+        with self.assertNumQueries(queries):
+            self.assertEqual(self.get(path, token).status_code, 200)
+
+    def test_professor_all_exams(self):
+        students = [self.student, self.make_student("other")]
+        self.assertConstantQueries(
+            "/api/professor/exams/", "prof-token",
+            lambda i: self.make_exam(f"E{i}", students), queries=1,
+        )
+
+    def test_professor_exam_submissions(self):
+        exam = self.make_exam("E", [])
+        questions = list(exam.assessment_questions.all())
+
+        def submit(i):
+            student = self.make_student(f"s{i}")
+            submission = StudentExamSubmission.objects.create(student=student, exam=exam)
+            for question in questions:
+                StudentAnswer.objects.create(submission=submission, question=question, answer_text="an answer")
+
+        self.assertConstantQueries(f"/api/professor/exams/{exam.id}/submissions/", "prof-token", submit, queries=6)
+
+    def test_student_course_exams(self):
+        self.assertConstantQueries(
+            f"/api/student/courses/{self.course.id}/exams/", "student-token",
+            lambda i: self.make_exam(f"E{i}", [self.student] if i % 2 else []), queries=2,
+        )
+
+    def test_student_all_grades(self):
+        self.assertConstantQueries(
+            "/api/student/exams/grades/", "student-token",
+            lambda i: self.make_exam(f"E{i}", [self.student]), queries=3,
+        )
+
+
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        authentication.cache.clear()
+        authentication.cache.checked_at = None
+        professor = Professor.objects.create(full_name="Prof", email="prof@example.com", institution_name="Uni", password="x")
+        UserToken.objects.create(token="prof-token", user_type="professor", user_id=professor.id)
+
+    def test_each_request_gets_its_own_user(self):
+        first = authentication.resolve("prof-token")
+        first.user.full_name = "changed by a view"
+        with self.assertNumQueries(0):
+            self.assertEqual(authentication.resolve("prof-token").user.full_name, "Prof")
+
+    def test_logout_in_another_process_is_seen_after_the_check_interval(self):
+        authentication.resolve("prof-token")
+        # Another process logs out: the row goes and the shared generation changes
+        with self.captureOnCommitCallbacks(execute=True):
+            UserToken.objects.filter(token="prof-token").delete()
+        authentication.cache.set("prof-token", authentication.Principal("prof-token", "professor", 1, None),
+                                 authentication.cache.generation)
+        self.assertIsNotNone(authentication.resolve("prof-token"))
+        authentication.cache.checked_at -= authentication.REVOCATION_CHECK_SECONDS
+        self.assertIsNone(authentication.resolve("prof-token"))
+
+
+class GraderRegistryTests(SimpleTestCase):
+
+    def test_concurrent_misses_load_once(self):
+        registry = GraderRegistry()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            time.sleep(0.05)
+            return object(), 10
+
+        threads = [Thread(target=registry.get, args=(1, 1, loader)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(loads), 1)
+
+    def test_memory_stays_bounded_across_many_exams(self):
+        registry = GraderRegistry(max_entries=4)
+        locks = len(registry._load_locks)
+        for exam_id in range(1000):
+            registry.get(exam_id, 1, lambda: (object(), 10))
+            registry.invalidate(exam_id - 1)
+        self.assertLessEqual(registry.stats()["entries"], 4)
+        self.assertEqual(len(registry._load_locks), locks)
@@ -0,0 +1,106 @@
+import time
+
+from django.core.cache import cache
+from rest_framework.throttling import SimpleRateThrottle
+
+from .authentication import Principal
+from .grader_utils import metrics
+
+
+# Rate limits for expensive endpoints (LLM grading, note embedding), kept in
+# the shared cache so every process and node counts against the same limits.
+# Each check is one cache read and one write: sub-millisecond with Redis, four
+# queries with the database cache used when REDIS_URL is not set.
+# Rates are set per scope in REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]; a scope
+# without a rate is not limited.
+
+
+def token_principal(request):
+    """
+    (user_type, user_id) of the request's token (see authentication.py), ("anonymous", None) without a valid one.
+    """
+    principal = request.user
+    if isinstance(principal, Principal):
+        return principal.user_type, principal.user_id
+    return "anonymous", None
+
+
+class MeteredRateThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle whose scope is chosen per request, with decisions and their cost in metrics.
+    """
+    cache = cache
+
+    def __init__(self):
+        # The scope, and so the rate, is only known once the request is seen
+        pass
+
+    def get_scope(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        started = time.perf_counter()
+        self.scope = self.get_scope(request, view)
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        allowed = super().allow_request(request, view)
+        metrics.THROTTLE_DECISIONS.inc(scope=self.scope, outcome="allowed" if allowed else "throttled")
+        metrics.THROTTLE_SECONDS.observe(time.perf_counter() - started, scope=self.scope)
+        return allowed
+
+    def get_rate(self):
+        return self.THROTTLE_RATES.get(self.scope)
+
+
+class UserTypeRateThrottle(MeteredRateThrottle):
+    """
+    Per user, at the rate of "<scope_prefix>_<user type>" (professor, student, anonymous).
+    """
+    scope_prefix = None
+
+    def get_scope(self, request, view):
+        user_type, _ = token_principal(request)
+        return f"{self.scope_prefix}_{user_type}"
+
+    def get_cache_key(self, request, view):
+        user_type, user_id = token_principal(request)
+        ident = f"{user_type}:{user_id}" if user_id is not None else self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class CourseRateThrottle(MeteredRateThrottle):
+    """
+    Per course (the view's course_id), shared by everyone calling the endpoint for that course.
+    """
+    scope_name = None
+
+    def get_scope(self, request, view):
+        return self.scope_name
+
+    def get_cache_key(self, request, view):
+        course_id = view.kwargs.get("course_id")
+        if course_id is None:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": f"course:{course_id}"}
+
+
+class GradingUserThrottle(UserTypeRateThrottle):
+    scope_prefix = "grading"
+
+
+class GradingCourseThrottle(CourseRateThrottle):
+    scope_name = "grading_course"
+
+
+class NoteUploadUserThrottle(UserTypeRateThrottle):
+    scope_prefix = "note_upload"
+
+
+class NoteUploadCourseThrottle(CourseRateThrottle):
+    scope_name = "note_upload_course"
+
+
+GRADING_THROTTLES = [GradingUserThrottle, GradingCourseThrottle]
+NOTE_UPLOAD_THROTTLES = [NoteUploadUserThrottle, NoteUploadCourseThrottle]
@@ -19,6 +19,7 @@ router.register(r'questions', views.AssessmentQuestionViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('login/', LoginView.as_view(), name='login'),  
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('create-course/', CreateCourseView.as_view(), name='create-course'),
 
     path('get-courses/', ProfessorCoursesView.as_view(), name='professor-courses'),
@@ -32,6 +33,9 @@ urlpatterns = [
     path('courses/<int:course_id>/upload-note/', UploadCourseNoteView.as_view(), name='upload-course-note'),
     path('courses/<int:course_id>/notes/', GetCourseNotesView.as_view(), name='get-course-notes'),
     path('courses/<int:course_id>/exams/<int:exam_id>/students/<int:student_id>/grade/', StudentExamAnswersView.as_view(), name='student-exam-answers'),
+    path('courses/<int:course_id>/exams/<int:exam_id>/students/<int:student_id>/grade/stream/', StudentExamAnswersStreamView.as_view(), name='student-exam-answers-stream'),
+    path('courses/<int:course_id>/exams/<int:exam_id>/grade-all/', GradeExamView.as_view(), name='grade-exam'),
+    path('courses/<int:course_id>/exams/<int:exam_id>/grade-all/clustered/', ExamClusteredGradingView.as_view(), name='exam-clustered-grading'),
     path('courses/<int:course_id>/exams/<int:exam_id>/students/<int:student_id>/save-grades/', SaveGradesView.as_view(), name='save-grades'),
     path('courses/<int:course_id>/exams/<int:exam_id>/students/<int:student_id>/update-grades/',UpdateSubmissionView.as_view(),name='update-submission'),
     path('courses/<int:course_id>/exams/<int:exam_id>/delete/',DeleteExamView.as_view(),name='delete-exam'),
@@ -46,4 +50,6 @@ urlpatterns = [
     path("professor/exams/<int:exam_id>/students/<int:student_id>/grades/", ProfessorStudentExamGradesView.as_view(),name="professor-student-exam-grades"),
 
     path('notes/<int:note_id>/delete/', DeleteCourseNoteView.as_view(), name='delete-course-note'),
+
+    path('metrics/grading/', GradingMetricsView.as_view(), name='grading-metrics'),
 ]
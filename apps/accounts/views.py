@@ -8,35 +8,49 @@ from django.contrib.auth.hashers import check_password
 from .models import Professor, Student
 import uuid
 from .models import UserToken
+from .authentication import Principal, token_from_header
 from .serializers import *
 from django.db import transaction
 from django.utils.timezone import localtime
 from rest_framework.parsers import MultiPartParser, FormParser
 import os
+import hmac
 import numpy as np
 import faiss
 import pickle
 from PyPDF2 import PdfReader
-from sentence_transformers import SentenceTransformer
-from .models import CourseNote, DocumentChunk
-from .grader_utils.execute_grader import ExecuteGrader
+from .models import CourseNote, DocumentChunk, GraderSpec, GradingRun, Job
+from .jobs import enqueue
+from .grading_runs import start_grading_run, run_report
+from .grader_utils.execute_grader import ExecuteGrader, question_fingerprint
 from .grader_utils.grader import Grader
-from django.db.models import Prefetch
+from .grader_utils.context import build_context, CANDIDATES as CONTEXT_CANDIDATES
+from .grader_utils.embeddings import get_embedder
+from .grader_utils.registry import registry as grader_registry
+from .grader_utils import scheduler as grading_scheduler
+from .grader_utils import admission as grading_admission
+from .throttles import GRADING_THROTTLES, NOTE_UPLOAD_THROTTLES
+from .pagination import OptionalCursorPagination
+from django.db.models import Exists, F, FilteredRelation, OuterRef, Prefetch, Q
 import pickle
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse, HttpResponse
+from .grader_utils import metrics as grading_metrics
 
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
 
-
-def retrieve_relevant_chunks(query, course_id, top_k=3):
+def retrieve_candidate_chunks(query, course_id, k):
     """
-    Retrieve the most relevant text chunks for a given query from ALL notes under a specific course.
+    Retrieve the k nearest chunks for a query from ALL notes under a specific course.
+    Returns (query_embedding, [(chunk_id, text, embedding)]) ordered by distance.
     """
     # Gather all chunks across all notes in the course
-    chunks = DocumentChunk.objects.filter(note__course_id=course_id)
+    chunks = DocumentChunk.objects.filter(note__course_id=course_id).order_by("id")
 
     if not chunks.exists():
-        return []
+        return None, []
 
+    ids = []
     texts = []
     embeddings = []
 
@@ -46,11 +60,12 @@ def retrieve_relevant_chunks(query, course_id, top_k=3):
             emb = pickle.loads(c.embedding)
             embeddings.append(emb)
             texts.append(c.chunk_text)
+            ids.append(c.id)
         except Exception as e:
             print(f"Skipping corrupt embedding for chunk {c.id}: {e}")
 
     if not embeddings:
-        return []
+        return None, []
 
     embeddings = np.array(embeddings).astype("float32")
 
@@ -60,16 +75,24 @@ def retrieve_relevant_chunks(query, course_id, top_k=3):
     index.add(embeddings)
 
     # Encode query
-    q_emb = embedder.encode(query, convert_to_numpy=True).astype("float32")
+    q_emb = get_embedder().encode(query, convert_to_numpy=True).astype("float32")
 
     # Search
-    D, I = index.search(np.array([q_emb]), top_k)
-    retrieved = [texts[i] for i in I[0]]
+    D, I = index.search(np.array([q_emb]), min(k, len(texts)))
+    return q_emb, [(ids[i], texts[i], embeddings[i]) for i in I[0] if i >= 0]
 
-    return retrieved
 
+def retrieve_relevant_chunks(query, course_id, top_k=3, token_budget=None):
+    """
+    Retrieve the most relevant text chunks for a given query from ALL notes under a specific course,
+    with overlapping chunks merged, near-duplicates dropped and the total trimmed to a token budget.
+    """
+    q_emb, candidates = retrieve_candidate_chunks(query, course_id, max(top_k, CONTEXT_CANDIDATES))
+    if not candidates:
+        return []
+
+    return build_context(q_emb, candidates, top_k=top_k, token_budget=token_budget)
 
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
 
 def load_pdf_text(pdf_path):
     reader = PdfReader(pdf_path)
@@ -87,92 +110,219 @@ def chunk_text(text, chunk_size=550, overlap=50):
         chunks.append(" ".join(words[i:i + chunk_size]))
     return chunks
 
+def grader_build_source(exam):
+    # Everything a grader spec is built from; a build is only saved if this is unchanged
+    questions = AssessmentQuestion.objects.filter(exam_id=exam.id).order_by("id").values_list(
+        "id", "question", "question_weight", "min_words", "reference_answer"
+    )
+    return exam.rubrics, list(questions)
+
 def create_and_save_grader(exam: Exam, course_id):
+    """
+    Build the exam's grader and save it as a new spec version. Questions whose text
+    and weight are unchanged since the previous version keep their retrieved context;
+    only new or changed questions go through retrieval.
+    """
+    source = grader_build_source(exam)
     # Fetch questions for context
-    questions = AssessmentQuestion.objects.filter(exam=exam)
+    questions = AssessmentQuestion.objects.filter(exam=exam).order_by("id")
+
+    previous = GraderSpec.objects.filter(exam=exam).values_list("spec", flat=True).first() or {}
+    reusable = {
+        question_fingerprint(q["question"], q["question_weight"]): q["context"]
+        for q in previous.get("questions", [])
+        if q.get("context") is not None
+    }
 
     retrived_chunks = {}
+    retrieved = 0
     for q in questions:
-        retrived_chunks[q] = retrieve_relevant_chunks(q.question, course_id)
+        context = reusable.get(question_fingerprint(q.question, q.question_weight))
+        if context is None:
+            context = retrieve_relevant_chunks(q.question, course_id)
+            retrieved += 1
+        retrived_chunks[q.question] = context
 
     grader_executor = ExecuteGrader(
-        rubrics=exam.rubrics,
+        rubrics=source[0],
         retrived_chunks=retrived_chunks,
         assessments=questions,
         strictness=1
     )
 
-    save_dir = "graders"
-    os.makedirs(save_dir, exist_ok=True)
-    filepath = os.path.join(save_dir, f"exam_{exam.id}_graders.pkl")
+    with transaction.atomic():
+        # Locks the exam row, which EditExamView also updates
+        current = Exam.objects.select_for_update().get(id=exam.id)
+        if grader_build_source(current) != source:
+            print(f"Exam {exam.id} changed while its grader was being built; discarding this build.")
+            return None
+        grader_spec = save_grader(exam.id, grader_executor)
 
-    with open(filepath, "wb") as file_handler:
-        pickle.dump(grader_executor, file_handler)
+    print(f"Grader saved successfully! (v{grader_spec.version}, {retrieved}/{len(source[1])} questions retrieved)")
+    return grader_spec
 
-    print("Grader saved successfully!")
+def schedule_grader_build(exam_id, course_id, tenant=""):
+    """
+    Build the exam's grader in the background ("build_grader" job). A build still
+    waiting in the queue already sees the latest questions, so at most one is queued per exam.
+    """
+    with transaction.atomic():
+        if Job.objects.select_for_update().filter(kind="build_grader", status="queued", payload__exam_id=exam_id).exists():
+            return
+        enqueue("build_grader", {"exam_id": exam_id, "course_id": course_id}, priority="background", tenant=tenant)
+
+def overloaded_response(e):
+    return Response(
+        {"error": str(e), "retry_after": e.retry_after},
+        status=503,
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
-def load_grader(exam_id):
-    save_dir = "graders"
-    filepath = os.path.join(save_dir, f"exam_{exam_id}_graders.pkl")
+def authenticated(request, user_type, forbidden):
+    """
+    Check the request was authenticated (see authentication.py) as a `user_type`.
+    Returns (error_response, None) on failure, (None, professor_or_student) otherwise.
+    """
+    principal = request.user
+    if not isinstance(principal, Principal):
+        if token_from_header(request) is None:
+            return Response({"error": "Missing or invalid Authorization header"}, status=401), None
+        return Response({"error": "Invalid or expired token"}, status=401), None
+    if principal.user_type != user_type:
+        return Response({"error": forbidden}, status=403), None
+    if principal.user is None:
+        return Response({"error": f"{user_type.capitalize()} not found"}, status=404), None
+    return None, principal.user
+
+
+def ingest_note_chunks(note_id, chunks):
+    """
+    Embed a note's chunks and save them; replaces chunks saved by an earlier attempt.
+    """
+    if not CourseNote.objects.filter(id=note_id).exists():
+        return 0
+    embeddings = get_embedder().encode(chunks, convert_to_numpy=True)
+    with transaction.atomic():
+        DocumentChunk.objects.filter(note_id=note_id).delete()
+        DocumentChunk.objects.bulk_create([
+            DocumentChunk(note_id=note_id, chunk_text=chunk_text_item, embedding=pickle.dumps(emb.astype(np.float32)))
+            for chunk_text_item, emb in zip(chunks, embeddings)
+        ])
+    return len(chunks)
+
+def load_current_grader(exam, course_id, questions=None):
+    """
+    The exam's grader, built right away if there is none yet or it was built for
+    different questions or another rubric (an edit whose background rebuild has
+    not finished).
+    """
+    if questions is None:
+        questions = AssessmentQuestion.objects.filter(exam=exam)
+    try:
+        grader_executor = load_grader(exam.id)
+    except Exception:
+        grader_executor = None
 
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"No saved grader found for exam {exam_id}")
+    if grader_executor is None or not grader_executor.matches(questions, exam.rubrics):
+        create_and_save_grader(exam=exam, course_id=course_id)
+        grader_executor = load_grader(exam.id)
+    return grader_executor
 
-    with open(filepath, "rb") as file_handler:
-        grader = pickle.load(file_handler)
+def save_grader(exam_id, grader_executor):
+    """
+    Store the grader's spec for the exam, bumping its version.
+    """
+    with transaction.atomic():
+        grader_spec, created = GraderSpec.objects.select_for_update().get_or_create(
+            exam_id=exam_id, defaults={"spec": grader_executor.to_spec()}
+        )
+        if not created:
+            grader_spec.spec = grader_executor.to_spec()
+            grader_spec.version += 1
+            grader_spec.save()
+    grader_registry.invalidate(exam_id)
+    return grader_spec
+
+def legacy_grader_path(exam_id):
+    # Graders used to be pickled here; read once to convert, removed with the exam
+    return os.path.join("graders", f"exam_{exam_id}_graders.pkl")
+
+def delete_legacy_grader(exam_id):
+    grader_path = legacy_grader_path(exam_id)
+    if os.path.exists(grader_path):
+        try:
+            os.remove(grader_path)
+        except OSError:
+            # If removing fails, still continue – DB will roll back on exception
+            pass
 
-    return grader
+def load_grader(exam_id):
+    version = GraderSpec.objects.filter(exam_id=exam_id).values_list("version", flat=True).first()
+
+    if version is None:
+        filepath = legacy_grader_path(exam_id)
+        if not os.path.exists(filepath):
+            raise GraderSpec.DoesNotExist(f"No saved grader found for exam {exam_id}")
+        with open(filepath, "rb") as file_handler:
+            legacy_executor = pickle.load(file_handler)
+        if any(getattr(grader, "context", None) is None for grader in legacy_executor.graders.values()):
+            # Pickled without its retrieved context: converting it would keep grading
+            # without context for good, so rebuild it and use the pickle until then
+            exam = Exam.objects.select_related("course").get(id=exam_id)
+            schedule_grader_build(exam_id, exam.course_id, grading_scheduler.tenant_key(exam.course))
+            return legacy_executor
+        save_grader(exam_id, legacy_executor)
+        return load_grader(exam_id)
+
+    def load():
+        spec = GraderSpec.objects.values_list("spec", flat=True).get(exam_id=exam_id)
+        return ExecuteGrader.from_spec(spec), len(json.dumps(spec))
+
+    # Reuse this process's copy unless the spec was saved again since it was loaded
+    return grader_registry.get(exam_id, version, load)
 
 
 class StudentExamAnswersView(APIView):
     """
     Get all answers of a specific student for a specific exam in a specific course.
     """
-
-    def get(self, request, course_id, exam_id, student_id):
+    throttle_classes = GRADING_THROTTLES
+
+    def prepare_grading(self, request, course_id, exam_id, student_id):
+        """
+        Validate the request and collect everything needed to grade the submission.
+        Returns (error_response, None) on failure, (None, grading) otherwise;
+        the caller must release grading["ticket"] once grading is done.
+        """
         # Token validation
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can access this endpoint"}, status=403)
-
-        # Validate professor and course
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
+        error, professor = authenticated(request, "professor", "Only professors can access this endpoint")
+        if error:
+            return error, None
 
+        # Validate course
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
-            return Response({"error": "Course not found or unauthorized"}, status=404)
+            return Response({"error": "Course not found or unauthorized"}, status=404), None
 
         # Validate exam
         try:
             exam = Exam.objects.get(id=exam_id, course=course)
         except Exam.DoesNotExist:
-            return Response({"error": "Exam not found for this course"}, status=404)
+            return Response({"error": "Exam not found for this course"}, status=404), None
 
         # Validate student and submission
         try:
             student = Student.objects.get(id=student_id)
         except Student.DoesNotExist:
-            return Response({"error": "Student not found"}, status=404)
+            return Response({"error": "Student not found"}, status=404), None
 
         try:
             submission = StudentExamSubmission.objects.prefetch_related(
                 Prefetch("answers", queryset=StudentAnswer.objects.select_related("question"))
             ).get(student=student, exam=exam)
         except StudentExamSubmission.DoesNotExist:
-            return Response({"error": "Student has not submitted this exam"}, status=404)
+            return Response({"error": "Student has not submitted this exam"}, status=404), None
 
         # Fetch questions for context
         questions = AssessmentQuestion.objects.filter(exam=exam)
@@ -192,6 +342,7 @@ class StudentExamAnswersView(APIView):
                 "min_words": q.min_words,
                 "answer_text": answer_obj.answer_text if answer_obj else None,
                 "is_graded": answer_obj.is_graded if answer_obj else False,
+                "needs_review": answer_obj.needs_review if answer_obj else False,
                 "received_weight": answer_obj.received_weight if answer_obj else 0.0,
                 "feedback": answer_obj.feedback if answer_obj else ""
             })
@@ -201,30 +352,181 @@ class StudentExamAnswersView(APIView):
         #         assessments=questions,
         #         strictness=1) 
 
-        try:
-            grader_executor = load_grader(exam_id)
-        except:
-            create_and_save_grader(exam=exam, course_id=course_id)
-            grader_executor = load_grader(exam_id)
+        # Shed load before any grading work when the LLM backlog is too long
+        try:
+            ticket = grading_admission.controller.admit("interactive")
+        except grading_admission.Overloaded as e:
+            return overloaded_response(e), None
+        try:
+            grader_executor = load_current_grader(exam, course_id, questions)
+        except BaseException:
+            ticket.release()
+            raise
+
+        return None, {
+            "ticket": ticket,
+            "grader_executor": grader_executor,
+            "answers_data": answers_data,
+            "tenant": grading_scheduler.tenant_key(course),
+            "summary": {
+                "course": course.course_name,
+                "exam": exam.exam_name,
+                "student_id": student.id,
+                "student_name": student.full_name,
+                "student_email": student.email,
+                "submitted_at": submission.submitted_at,
+                "overall_received_score": submission.overall_received_score,
+                "overall_feedback": submission.overall_feedback or "",
+                "total_questions": len(questions),
+            },
+        }
+
+    def get(self, request, course_id, exam_id, student_id):
+        error, grading = self.prepare_grading(request, course_id, exam_id, student_id)
+        if error is not None:
+            return error
 
-        grader_executor.grade_exams(answers_data)
+        answers_data = grading["answers_data"]
+        with grading["ticket"], grading_scheduler.priority("interactive", grading["tenant"]):
+            grading["grader_executor"].grade_exams(answers_data)
         print("Grading Done!")   
+        token_usage = ExecuteGrader.usage_report(answers_data)
 
 
         # Return JSON response
         return Response({
-            "course": course.course_name,
-            "exam": exam.exam_name,
-            "student_id": student.id,
-            "student_name": student.full_name,
-            "student_email": student.email,
-            "submitted_at": submission.submitted_at,
-            "overall_received_score": submission.overall_received_score,
-            "overall_feedback": submission.overall_feedback or "",
-            "total_questions": len(questions),
+            **grading["summary"],
+            "token_usage": token_usage,
             "answers": answers_data
         }, status=200)
-    
+
+
+class StudentExamAnswersStreamView(StudentExamAnswersView):
+    """
+    Streaming variant of StudentExamAnswersView.
+    Responds with newline-delimited JSON (application/x-ndjson):
+      {"event": "result", "answer": {...}}    one line per question, in completion order
+      {"event": "summary", ...}               last line, same fields as the non-streaming endpoint
+                                              (without "answers")
+    """
+
+    def get(self, request, course_id, exam_id, student_id):
+        error, grading = self.prepare_grading(request, course_id, exam_id, student_id)
+        if error is not None:
+            return error
+
+        def events():
+            graded = []
+            with grading_scheduler.priority("interactive", grading["tenant"]):
+                for asmt in grading["grader_executor"].iter_grade_exams(grading["answers_data"]):
+                    graded.append(asmt)
+                    yield json.dumps({"event": "result", "answer": asmt}, cls=DjangoJSONEncoder) + "\n"
+            print("Grading Done!")
+            yield json.dumps({
+                "event": "summary",
+                **grading["summary"],
+                "graded_questions": sum(1 for asmt in graded if asmt.get("status") == "graded"),
+                "pending_questions": sum(1 for asmt in graded if asmt.get("status") == "pending"),
+                "token_usage": ExecuteGrader.usage_report(graded),
+            }, cls=DjangoJSONEncoder) + "\n"
+
+        # The admission ticket is held until the stream is closed
+        response = StreamingHttpResponse(
+            grading_admission.ReleasingIterator(events(), grading["ticket"]),
+            content_type="application/x-ndjson",
+        )
+        # Ask reverse proxies not to buffer the stream
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class GradeExamView(APIView):
+    """
+    Grade every ungraded answer of an exam in the background (see grading_runs.py).
+    POST starts a run (202), or returns the run already in progress (200).
+    GET returns the progress of the latest run: counts, wall time, throughput and cost.
+    Requires: Authorization: Token <token_value> (professor)
+    """
+    mode = "batched"
+
+    def get_exam(self, request, course_id, exam_id):
+        """
+        Returns (error_response, None) on failure, (None, exam) otherwise.
+        """
+        error, professor = authenticated(request, "professor", "Only professors can grade exams")
+        if error:
+            return error, None
+
+        try:
+            course = Course.objects.get(id=course_id, professor=professor)
+        except Course.DoesNotExist:
+            return Response({"error": "Course not found or unauthorized"}, status=404), None
+
+        try:
+            exam = Exam.objects.get(id=exam_id, course=course)
+        except Exam.DoesNotExist:
+            return Response({"error": "Exam not found for this course"}, status=404), None
+
+        return None, exam
+
+    def post(self, request, course_id, exam_id):
+        error, exam = self.get_exam(request, course_id, exam_id)
+        if error is not None:
+            return error
+
+        run, created = start_grading_run(exam, mode=self.mode)
+        return Response(run_report(run), status=202 if created else 200)
+
+    def get(self, request, course_id, exam_id):
+        error, exam = self.get_exam(request, course_id, exam_id)
+        if error is not None:
+            return error
+
+        run = GradingRun.objects.filter(exam=exam).order_by("-id").first()
+        ungraded = StudentAnswer.objects.filter(submission__exam=exam, is_graded=False).count()
+        return Response({
+            "ungraded_answers": ungraded,
+            "run": run_report(run) if run is not None else None,
+        }, status=200)
+
+
+class ExamClusteredGradingView(GradeExamView):
+    """
+    POST/GET /api/courses/<course_id>/exams/<exam_id>/grade-all/clustered/
+    Like grade-all, but each question's ungraded answers are clustered and only one
+    representative of each group of near-identical answers is graded with the LLM.
+    Copied results are saved with needs_review set; the run report adds the
+    clustering counts. An exam has one active run at a time, of either mode.
+    Requires: Authorization: Token <token_value> (professor)
+    """
+    mode = "clustered"
+
+
+class GradingMetricsView(APIView):
+    """
+    GET /api/metrics/grading/
+    Grading instrumentation of this worker process (latency histograms, token,
+    retry and JSON-failure counters, queue wait), tagged by exam and question.
+    Prometheus text format by default; ?output=json for a JSON snapshot with p50/p95/p99.
+    Requires a professor token, or "Authorization: Bearer <GRADER_METRICS_TOKEN>" for scrapers.
+    """
+
+    def get(self, request):
+        auth_header = request.headers.get("Authorization") or ""
+        scraper = (
+            grading_metrics.METRICS_TOKEN is not None
+            and hmac.compare_digest(auth_header, f"Bearer {grading_metrics.METRICS_TOKEN}")
+        )
+        if not scraper:
+            error, _ = authenticated(request, "professor", "Only professors can read grading metrics")
+            if error:
+                return error
+
+        if request.query_params.get("output") == "json":
+            return HttpResponse(grading_metrics.render_json(), content_type="application/json")
+        return HttpResponse(grading_metrics.render_prometheus(), content_type="text/plain; version=0.0.4")
+
 
 class DeleteCourseNoteView(APIView):
     """
@@ -237,25 +539,11 @@ class DeleteCourseNoteView(APIView):
 
     def delete(self, request, note_id):
         # Token validation
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can delete notes"}, status=403)
-
-        # Get professor and note
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
+        error, professor = authenticated(request, "professor", "Only professors can delete notes")
+        if error:
+            return error
 
+        # Get note
         try:
             note = CourseNote.objects.get(id=note_id, professor=professor)
         except CourseNote.DoesNotExist:
@@ -288,23 +576,14 @@ class DeleteCourseNoteView(APIView):
 
 class UploadCourseNoteView(APIView):
     parser_classes = [MultiPartParser, FormParser]
+    throttle_classes = NOTE_UPLOAD_THROTTLES
     def post(self, request, course_id):
         # --- Token Validation ---
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can upload notes"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can upload notes")
+        if error:
+            return error
 
         # --- Professor and Course Validation ---
-        professor = Professor.objects.get(id=token_obj.user_id)
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -331,6 +610,7 @@ class UploadCourseNoteView(APIView):
                 )
 
                 # Step 2: Process PDF
+                ingestion_job = None
                 if file.name.lower().endswith(".pdf"):
                     pdf_path = course_note.file.path
                     try:
@@ -342,26 +622,28 @@ class UploadCourseNoteView(APIView):
                         if not chunks:
                             raise ValueError("Chunking failed or produced empty chunks.")
 
-                        embeddings = embedder.encode(chunks, convert_to_numpy=True)
-
-                        # Step 3: Save chunks
-                        for chunk_text_item, emb in zip(chunks, embeddings):
-                            binary_emb = pickle.dumps(emb.astype(np.float32))
-                            DocumentChunk.objects.create(
-                                note=course_note,
-                                chunk_text=chunk_text_item,
-                                embedding=binary_emb
-                            )
-
                     except Exception as e:
                         # Rollback and delete file if chunking fails
                         if os.path.exists(course_note.file.path):
                             os.remove(course_note.file.path)
                         raise e
 
+                    # Step 3: Embed and save chunks in the background ("ingest_note" job).
+                    # The chunks travel with the job, so any worker node can process it.
+                    ingestion_job = enqueue(
+                        "ingest_note",
+                        {"note_id": course_note.id, "chunks": chunks},
+                        idempotency_key=f"ingest_note:{course_note.id}",
+                        priority="background",
+                        tenant=grading_scheduler.tenant_key(course),
+                    )
+
                 # Step 4: Return successful response
                 serializer = CourseNoteSerializer(course_note)
-                return Response(serializer.data, status=201)
+                return Response({
+                    **serializer.data,
+                    "ingestion_job_id": ingestion_job.id if ingestion_job else None,
+                }, status=201)
 
         except Exception as e:
             print(e)
@@ -387,29 +669,17 @@ class ProfessorExamSubmissionsView(APIView):
     - Exam info (name, course, enrolled/submitted counts)
     - All questions
     - Each student's submission details (answers, grading status, etc.)
+    Query params:
+    - include_answers=false  leave out each student's answers (list view)
+    - page_size, cursor      cursor pagination over students (adds "next"/"previous")
+    Costs a constant number of queries, whatever the number of students.
     """
 
     def get(self, request, exam_id):
         # Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        # Ensure only professors can access
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can access this endpoint"}, status=403)
-
-        # Get professor
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
+        error, professor = authenticated(request, "professor", "Only professors can access this endpoint")
+        if error:
+            return error
 
         # Get exam (ensure it belongs to this professor)
         try:
@@ -418,46 +688,57 @@ class ProfessorExamSubmissionsView(APIView):
             return Response({"error": "Exam not found or unauthorized"}, status=404)
 
         course = exam.course
-
-        # Collect metadata
-        enrolled_students = Student.objects.filter(enrollments__course=course).distinct()
-        submissions = StudentExamSubmission.objects.filter(exam=exam).select_related("student")
+        include_answers = request.query_params.get("include_answers", "true").lower() not in ("false", "0", "no")
+
+        # Enrolled students left-joined to their submission of this exam, in one query
+        students = (
+            Student.objects
+            .filter(enrollments__course=course)
+            .annotate(exam_submission=FilteredRelation("submissions", condition=Q(submissions__exam=exam)))
+            .annotate(
+                submission_id=F("exam_submission__id"),
+                submitted_at=F("exam_submission__submitted_at"),
+                has_ungraded=Exists(StudentAnswer.objects.filter(submission_id=OuterRef("submission_id"), is_graded=False)),
+            )
+            .only("id", "full_name")
+        )
+        students, links = OptionalCursorPagination(ordering="id").paginate(students, request, self)
+
+        # Answers of the students on this page, in one query
+        answers_by_submission = {}
+        if include_answers:
+            submission_ids = [student.submission_id for student in students if student.submission_id is not None]
+            for ans in (StudentAnswer.objects
+                        .filter(submission_id__in=submission_ids)
+                        .select_related("question")
+                        .order_by("id")):
+                answers_by_submission.setdefault(ans.submission_id, []).append(ans)
 
         # Build per-student submission data
         student_submission_data = []
-        for student in enrolled_students:
-            submission = submissions.filter(student=student).first()
-
-            if submission:
-                answers = StudentAnswer.objects.filter(submission=submission)
-                answers_serialized = [
+        for student in students:
+            is_submitted = student.submission_id is not None
+            entry = {
+                "student_id": student.id,
+                "student_name": student.full_name,
+                "is_submitted": is_submitted,
+                "submission_timestamp": localtime(student.submitted_at) if student.submitted_at else None,
+                "is_graded": is_submitted and not student.has_ungraded,
+            }
+            if include_answers:
+                entry["answers"] = [
                     {
                         "question_id": ans.question.id,
                         "question": ans.question.question,
                         "question_weight": ans.question.question_weight,
                         "answer_text": ans.answer_text,
                         "received_weight": ans.received_weight,
-                        "feedback": ans.feedback
+                        "feedback": ans.feedback,
+                        "needs_review": ans.needs_review,
                     }
-                    for ans in answers
+                    for ans in answers_by_submission.get(student.submission_id, [])
                 ]
-                student_submission_data.append({
-                    "student_id": student.id,
-                    "student_name": student.full_name,
-                    "is_submitted": True,
-                    "submission_timestamp": localtime(submission.submitted_at) if submission.submitted_at else None,
-                    "is_graded": all(a.is_graded for a in answers),
-                    "answers": answers_serialized
-                })
-            else:
-                student_submission_data.append({
-                    "student_id": student.id,
-                    "student_name": student.full_name,
-                    "is_submitted": False,
-                    "submission_timestamp": None,
-                    "is_graded": False,
-                    "answers": []
-                })
+            student_submission_data.append(entry)
 
         # Serialize questions
         questions = exam.assessment_questions.all()
@@ -467,11 +748,13 @@ class ProfessorExamSubmissionsView(APIView):
         response_data = {
             "exam_name": exam.exam_name,
             "course_name": course.course_name,
-            "num_enrolled_students": enrolled_students.count(),
-            "num_students_submitted": submissions.count(),
+            "num_enrolled_students": Enrollment.objects.filter(course=course).count(),
+            "num_students_submitted": StudentExamSubmission.objects.filter(exam=exam).count(),
             "questions": question_serializer.data,
             "student_submissions": student_submission_data,
         }
+        if links is not None:
+            response_data.update(links)
 
         return Response(response_data, status=200)
 
@@ -493,23 +776,11 @@ class UpdateSubmissionView(APIView):
 
     def patch(self, request, course_id, exam_id, student_id):
         # Auth: professor only
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-        token_value = auth_header.split(" ")[1]
-        try:
-            token = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-        if token.user_type != "professor":
-            return Response({"error": "Only professors can update grades"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can update grades")
+        if error:
+            return error
 
         # Entities & ownership
-        try:
-            professor = Professor.objects.get(id=token.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
-
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -566,6 +837,9 @@ class UpdateSubmissionView(APIView):
                             sa.feedback = item["feedback"] or ""
                         if "is_graded" in item:
                             sa.is_graded = bool(item["is_graded"])
+                        if "received_weight" in item or "is_graded" in item:
+                            # The professor's grade is final
+                            sa.needs_review = False
                         sa.save()
                         updated_answers += 1
 
@@ -598,32 +872,12 @@ class ProfessorAllExamsView(APIView):
 
     def get(self, request):
         #  Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response(
-                {"error": "Missing or invalid Authorization header"}, status=401
-            )
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        # Check professor type
-        if token_obj.user_type != "professor":
-            return Response(
-                {"error": "Only professors can access this endpoint"}, status=403
-            )
-
-        #  Fetch professor
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
+        error, professor = authenticated(request, "professor", "Only professors can access this endpoint")
+        if error:
+            return error
 
-        # Fetch all exams created by this professor
-        exams = Exam.objects.filter(course__professor=professor).select_related("course")
+        # Fetch all exams created by this professor, with their counts, in one query
+        exams = ProfessorExamSummarySerializer.with_counts(Exam.objects.filter(course__professor=professor))
 
         # Serialize results
         serializer = ProfessorExamSummarySerializer(exams, many=True)
@@ -637,25 +891,9 @@ class StudentGetCourseExamsView(APIView):
 
     def get(self, request, course_id):
         # Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        # Only students allowed
-        if token_obj.user_type != "student":
-            return Response({"error": "Only students can access this endpoint"}, status=403)
-
-        # Validate student existence
-        try:
-            student = Student.objects.get(id=token_obj.user_id)
-        except Student.DoesNotExist:
-            return Response({"error": "Student not found"}, status=404)
+        error, student = authenticated(request, "student", "Only students can access this endpoint")
+        if error:
+            return error
 
         # Validate course
         try:
@@ -664,11 +902,10 @@ class StudentGetCourseExamsView(APIView):
             return Response({"error": "Course not found"}, status=404)
 
 
-        # Fetch exams
-        exams = Exam.objects.filter(course=course).order_by('id')
+        # Fetch exams, with is_taken for this student, in one query
+        exams = StudentExamListSerializer.with_is_taken(Exam.objects.filter(course=course).order_by('id'), student)
 
-        # Pass student into serializer context
-        serializer = StudentExamListSerializer(exams, many=True, context={'student': student})
+        serializer = StudentExamListSerializer(exams, many=True)
         return Response(serializer.data, status=200)
 
 class TakeExamView(APIView):
@@ -678,18 +915,9 @@ class TakeExamView(APIView):
 
     def get(self, request, course_id, exam_id):
         # Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "student":
-            return Response({"error": "Only students can take exams"}, status=403)
+        error, _ = authenticated(request, "student", "Only students can take exams")
+        if error:
+            return error
 
         # Validate exam ownership within course
         try:
@@ -716,25 +944,11 @@ class SubmitExamView(APIView):
 
     def post(self, request, course_id, exam_id):
         # Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "student":
-            return Response({"error": "Only students can submit exams"}, status=403)
-
-        # Fetch student and exam
-        try:
-            student = Student.objects.get(id=token_obj.user_id)
-        except Student.DoesNotExist:
-            return Response({"error": "Student not found"}, status=404)
+        error, student = authenticated(request, "student", "Only students can submit exams")
+        if error:
+            return error
 
+        # Fetch exam
         try:
             exam = Exam.objects.get(id=exam_id, course_id=course_id)
         except Exam.DoesNotExist:
@@ -761,26 +975,11 @@ class UnenrollCourseView(APIView):
 
     def delete(self, request, course_id):
         # Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=status.HTTP_401_UNAUTHORIZED)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=status.HTTP_401_UNAUTHORIZED)
-
-        # Ensure student user
-        if token_obj.user_type != "student":
-            return Response({"error": "Only students can unenroll from courses"}, status=status.HTTP_403_FORBIDDEN)
-
-        # Find student and course
-        try:
-            student = Student.objects.get(id=token_obj.user_id)
-        except Student.DoesNotExist:
-            return Response({"error": "Student not found"}, status=status.HTTP_404_NOT_FOUND)
+        error, student = authenticated(request, "student", "Only students can unenroll from courses")
+        if error:
+            return error
 
+        # Find course
         try:
             course = Course.objects.get(id=course_id)
         except Course.DoesNotExist:
@@ -807,26 +1006,11 @@ class StudentEnrolledCoursesView(APIView):
 
     def get(self, request):
         
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        # Ensure it's a student
-        if token_obj.user_type != "student":
-            return Response({"error": "Only students can view enrolled courses"}, status=403)
-
-        # Fetch student and enrolled courses
-        try:
-            student = Student.objects.get(id=token_obj.user_id)
-        except Student.DoesNotExist:
-            return Response({"error": "Student not found"}, status=404)
+        error, student = authenticated(request, "student", "Only students can view enrolled courses")
+        if error:
+            return error
 
+        # Fetch enrolled courses
         enrolled_courses = Course.objects.filter(enrollments__student=student)
         serializer = EnrolledCourseSerializer(enrolled_courses, many=True)
         return Response(serializer.data, status=200)
@@ -840,26 +1024,11 @@ class EnrollCourseView(APIView):
 
     def post(self, request, course_id):
         # Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        # Ensure it's a student
-        if token_obj.user_type != "student":
-            return Response({"error": "Only students can enroll in courses"}, status=403)
-
-        # Find student and course
-        try:
-            student = Student.objects.get(id=token_obj.user_id)
-        except Student.DoesNotExist:
-            return Response({"error": "Student not found"}, status=404)
+        error, student = authenticated(request, "student", "Only students can enroll in courses")
+        if error:
+            return error
 
+        # Find course
         try:
             course = Course.objects.get(id=course_id)
         except Course.DoesNotExist:
@@ -885,25 +1054,11 @@ class EditExamView(APIView):
     @transaction.atomic
     def put(self, request, course_id, exam_id):
         # Authenticate professor
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can edit exams"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can edit exams")
+        if error:
+            return error
 
         # Verify professor and ownership
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
-
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -920,14 +1075,10 @@ class EditExamView(APIView):
         # Validate and update exam
         serializer = ExamUpdateSerializer(exam, data=request.data, partial=True)
 
-        try:
-            # whatever this does in your flow (rebuild grader, etc.)
-            create_and_save_grader(exam=exam, course_id=course_id)
-        except Exception:
-            return Response({"error": "Error in updating exam"}, status=404)
-
         if serializer.is_valid():
             updated_exam = serializer.save()
+            # Rebuild from the edited questions; until then grading builds it on demand
+            schedule_grader_build(updated_exam.id, course_id, grading_scheduler.tenant_key(course))
             return Response(
                 {
                     "message": "Exam updated successfully",
@@ -946,26 +1097,11 @@ class GetCourseExamsView(APIView):
 
     def get(self, request, course_id):
         # Validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        # Ensure professor
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can view exams"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can view exams")
+        if error:
+            return error
 
         # Verify professor and course ownership
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
-
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -985,29 +1121,11 @@ class CreateExamView(APIView):
     """
 
     def post(self, request, course_id):
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response(
-                {"error": "Missing or invalid Authorization header"},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        #  Ensure it's a professor
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can create exams"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can create exams")
+        if error:
+            return error
 
         #  Validate professor and course ownership
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
-
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -1031,7 +1149,7 @@ class CreateExamView(APIView):
         created_questions = []
         for q in questions_data:
             q["exam"] = exam.id
-            question_serializer = AssessmentQuestionSerializer(data=q)
+            question_serializer = AssessmentQuestionProfessorSerializer(data=q)
             if question_serializer.is_valid():
                 question_serializer.save(exam=exam)
                 created_questions.append(question_serializer.data)
@@ -1046,7 +1164,7 @@ class CreateExamView(APIView):
         # Return combined response
         response_data = ExamSerializer(exam).data
         response_data["assessment_questions"] = created_questions
-        create_and_save_grader(exam=exam, course_id=course_id)
+        schedule_grader_build(exam.id, course_id, grading_scheduler.tenant_key(course))
         return Response(response_data, status=201)
 
 
@@ -1058,37 +1176,9 @@ class ProfessorCoursesView(APIView):
 
     def get(self, request):
         #  Extract token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response(
-                {"error": "Missing or invalid Authorization header"},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response(
-                {"error": "Invalid or expired token"},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        #  Only professors allowed
-        if token_obj.user_type != "professor":
-            return Response(
-                {"error": "Only professors can view their courses"},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        #  Fetch professor
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response(
-                {"error": "Professor not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        error, professor = authenticated(request, "professor", "Only professors can view their courses")
+        if error:
+            return error
 
         #  Fetch all courses for that professor
         courses = Course.objects.filter(professor=professor).order_by('-id')
@@ -1101,37 +1191,9 @@ class CreateCourseView(APIView):
 
     def post(self, request):
         #  Extract and validate token
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response(
-                {"error": "Missing or invalid Authorization header"},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response(
-                {"error": "Invalid or expired token"},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        # Only professors can create courses
-        if token_obj.user_type != "professor":
-            return Response(
-                {"error": "Only professors can create courses"},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        #  Fetch professor record
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response(
-                {"error": "Professor not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        error, professor = authenticated(request, "professor", "Only professors can create courses")
+        if error:
+            return error
 
         #  Validate and save course
         serializer = CourseSerializer(data=request.data)
@@ -1228,6 +1290,25 @@ class LoginView(APIView):
         return Response({"error": "Invalid credentials"}, status=401)
     
 
+class LogoutView(APIView):
+    """
+    POST /api/logout/
+    Deletes the request's token; it stops authenticating at once in every process
+    (see authentication.py).
+    """
+
+    def post(self, request):
+        principal = request.user
+        if not isinstance(principal, Principal):
+            if token_from_header(request) is None:
+                return Response({"error": "Missing or invalid Authorization header"}, status=401)
+            return Response({"error": "Invalid or expired token"}, status=401)
+
+        # Deleting the token revokes it in every process's authentication cache (post_delete signal)
+        UserToken.objects.filter(token=principal.token).delete()
+        return Response({"message": "Logged out"}, status=200)
+
+
 class SaveGradesView(APIView):
     """
     Persist grading results for a student's exam.
@@ -1244,23 +1325,11 @@ class SaveGradesView(APIView):
 
     def post(self, request, course_id, exam_id, student_id):
         #  Auth: professor only
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-        token_value = auth_header.split(" ")[1]
-        try:
-            token = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-        if token.user_type != "professor":
-            return Response({"error": "Only professors can save grades"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can save grades")
+        if error:
+            return error
 
         # Ownership & entities
-        try:
-            professor = Professor.objects.get(id=token.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
-
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -1315,6 +1384,7 @@ class SaveGradesView(APIView):
                     qa.received_weight = ans["received_weight"]
                     qa.feedback = ans.get("feedback", "") or ""
                     qa.is_graded = ans.get("is_graded", True)
+                    qa.needs_review = False
                     qa.save()
                     updated += 1
 
@@ -1343,30 +1413,17 @@ class ProfessorStudentExamGradesView(APIView):
 
     Returns graded data for ONE student in ONE exam:
     - overall_received_score, overall_feedback
-    - per-question answer_text, received_weight, feedback, is_graded (+ question metadata)
+    - per-question answer_text, received_weight, feedback, is_graded, needs_review (+ question metadata)
     Reads directly from StudentExamSubmission + StudentAnswer.
     """
 
     def get(self, request, exam_id, student_id):
         # Auth: professor only
-        auth = request.headers.get("Authorization", "")
-        if not auth.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-        token_value = auth.split(" ", 1)[1]
-
-        try:
-            token = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-        if token.user_type != "professor":
-            return Response({"error": "Only professors can access this endpoint"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can access this endpoint")
+        if error:
+            return error
 
         # Scope exam to this professor
-        try:
-            professor = Professor.objects.get(id=token.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
-
         try:
             exam = Exam.objects.select_related("course").get(id=exam_id, course__professor=professor)
         except Exam.DoesNotExist:
@@ -1387,7 +1444,7 @@ class ProfessorStudentExamGradesView(APIView):
                         "answers",
                         queryset=StudentAnswer.objects.select_related("question").only(
                             "id", "submission_id", "question_id",
-                            "answer_text", "is_graded", "received_weight", "feedback",
+                            "answer_text", "is_graded", "needs_review", "received_weight", "feedback",
                             "question__question", "question__question_weight", "question__min_words"
                         )
                     )
@@ -1407,6 +1464,7 @@ class ProfessorStudentExamGradesView(APIView):
                 "min_words": int(getattr(q, "min_words", 0) or 0),
                 "answer_text": a.answer_text,
                 "is_graded": bool(a.is_graded),
+                "needs_review": bool(a.needs_review),
                 "received_weight": float(a.received_weight),
                 "feedback": a.feedback or ""
             })
@@ -1433,59 +1491,51 @@ class StudentAllGradesView(APIView):
     Student-only endpoint (UserToken.user_type == 'student').
     Optional query params:
       - only_graded=true|false  (default false) -> when true, show only submissions that have any graded answers or nonzero overall score.
+      - page_size, cursor       -> cursor pagination by submitted_at, newest first (adds "next"/"previous").
+    Costs a constant number of queries, whatever the number of exams.
     """
 
     def get(self, request):
         # 1) Auth: student only
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-        token_value = auth_header.split(" ")[1]
-        try:
-            token = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-        if token.user_type != "student":
-            return Response({"error": "Only students can access this endpoint"}, status=403)
-
-        # 2) Get student
-        try:
-            student = Student.objects.get(id=token.user_id)
-        except Student.DoesNotExist:
-            return Response({"error": "Student not found"}, status=404)
+        error, student = authenticated(request, "student", "Only students can access this endpoint")
+        if error:
+            return error
 
-        # 3) Fetch all submissions for this student (with exam, course, answers, questions)
+        # 2) Fetch all submissions for this student (with exam, course, answers, questions)
         submissions_qs = (
             StudentExamSubmission.objects
             .filter(student=student)
             .select_related("exam", "exam__course")
+            .order_by("-submitted_at", "-id")
             .prefetch_related(
-                Prefetch("answers", queryset=StudentAnswer.objects.select_related("question"))
+                Prefetch("answers", queryset=StudentAnswer.objects.order_by("id")),
+                Prefetch("exam__assessment_questions", queryset=AssessmentQuestion.objects.only(
+                    "id", "exam_id", "question", "question_weight", "min_words"
+                )),
             )
-            .order_by("-submitted_at")
         )
 
         # Optional filter: only_graded=true
         only_graded = str(request.query_params.get("only_graded", "false")).lower() == "true"
         if only_graded:
-            submissions_qs = [s for s in submissions_qs
-                              if (s.overall_received_score and s.overall_received_score > 0)
-                              or any(a.is_graded for a in s.answers.all())]
+            submissions_qs = submissions_qs.filter(
+                Q(overall_received_score__gt=0)
+                | Exists(StudentAnswer.objects.filter(submission_id=OuterRef("pk"), is_graded=True))
+            )
 
-        if not submissions_qs:
-            return Response({"exams": []}, status=200)
+        submissions, links = OptionalCursorPagination(ordering=("-submitted_at", "-id")).paginate(
+            submissions_qs, request, self
+        )
 
-        # 4) Build response
+        # 3) Build response
         payload = []
-        for sub in submissions_qs:
+        for sub in submissions:
             exam = sub.exam
             course = exam.course
             answers = sub.answers.all()
 
             # Map per question
-            questions = AssessmentQuestion.objects.filter(exam=exam).only(
-                "id", "question", "question_weight", "min_words"
-            )
+            questions = exam.assessment_questions.all()
             q_map = {q.id: q for q in questions}
 
             per_question = []
@@ -1504,6 +1554,7 @@ class StudentAllGradesView(APIView):
                     "received_weight": ans.received_weight,
                     "feedback": ans.feedback or "",
                     "is_graded": bool(ans.is_graded),
+                    "needs_review": bool(ans.needs_review),
                 })
                 if ans.is_graded:
                     graded_count += 1
@@ -1517,12 +1568,15 @@ class StudentAllGradesView(APIView):
                 "submitted_at": sub.submitted_at,
                 "overall_received_score": sub.overall_received_score,
                 "overall_feedback": sub.overall_feedback or "",
-                "questions_count": questions.count(),
+                "questions_count": len(questions),
                 "graded_answers_count": graded_count,
                 "answers": per_question
             })
 
-        return Response({"exams": payload}, status=200)
+        response_data = {"exams": payload}
+        if links is not None:
+            response_data.update(links)
+        return Response(response_data, status=200)
     
 
 class DeleteExamView(APIView):
@@ -1537,25 +1591,11 @@ class DeleteExamView(APIView):
     @transaction.atomic
     def delete(self, request, course_id, exam_id):
         # Auth: must be professor
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can delete exams"}, status=403)
+        error, professor = authenticated(request, "professor", "Only professors can delete exams")
+        if error:
+            return error
 
         # Verify professor and course ownership
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
-
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -1568,6 +1608,8 @@ class DeleteExamView(APIView):
             return Response({"error": "Exam not found for this course"}, status=404)
 
         exam_name = exam.exam_name
+        grader_registry.invalidate(exam.id)
+        delete_legacy_grader(exam.id)
 
         # Delete exam + cascades
         # This will delete:
@@ -1603,25 +1645,11 @@ class DeleteCourseView(APIView):
     @transaction.atomic
     def delete(self, request, course_id):
         # 1) Auth: professor only
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Token "):
-            return Response({"error": "Missing or invalid Authorization header"}, status=401)
-
-        token_value = auth_header.split(" ")[1]
-        try:
-            token_obj = UserToken.objects.get(token=token_value)
-        except UserToken.DoesNotExist:
-            return Response({"error": "Invalid or expired token"}, status=401)
-
-        if token_obj.user_type != "professor":
-            return Response({"error": "Only professors can delete courses"}, status=403)
-
-        # 2) Get professor and course
-        try:
-            professor = Professor.objects.get(id=token_obj.user_id)
-        except Professor.DoesNotExist:
-            return Response({"error": "Professor not found"}, status=404)
+        error, professor = authenticated(request, "professor", "Only professors can delete courses")
+        if error:
+            return error
 
+        # 2) Get course
         try:
             course = Course.objects.get(id=course_id, professor=professor)
         except Course.DoesNotExist:
@@ -1629,16 +1657,12 @@ class DeleteCourseView(APIView):
 
         # 3) Pre-delete cleanup
 
-        # 3a) Delete any grader files if you're using exam_<id>_graders.pkl pattern
+        # 3a) Drop loaded graders and any legacy exam_<id>_graders.pkl files
+        #     (GraderSpec rows CASCADE with the exams)
         exams = list(course.exams.all())
         for exam in exams:
-            grader_path = os.path.join("graders", f"exam_{exam.id}_graders.pkl")
-            if os.path.exists(grader_path):
-                try:
-                    os.remove(grader_path)
-                except OSError:
-                    # If removing fails, still continue – DB will roll back on exception
-                    pass
+            grader_registry.invalidate(exam.id)
+            delete_legacy_grader(exam.id)
 
         # 3b) Delete note files on disk, then notes (DocumentChunk will CASCADE)
         notes = course.notes.all()